@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from .models import Job, SlowQuery
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'origin', 'calls', 'total_time', 'max_time',
+                    'last_seen']
+    search_fields = ['origin', 'sql']
+    readonly_fields = ['fingerprint', 'sql', 'origin', 'stack', 'explain',
+                       'calls', 'total_time', 'max_time', 'last_seen']
+    empty_value_display = '-----'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'name', 'status', 'attempts', 'user', 'run_at',
+                    'updated_at']
+    list_filter = ['status', 'name']
+    list_select_related = ['user']
+    readonly_fields = ['created_at', 'updated_at', 'locked_at', 'locked_by']
+    empty_value_display = '-----'
@@ -0,0 +1,17 @@
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.metrics import AUTH_LOOKUPS
+
+
+class MeteredTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, считающий успешные и неудачные проверки."""
+
+    def authenticate_credentials(self, key):
+        try:
+            credentials = super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            AUTH_LOOKUPS.labels('failure').inc()
+            raise
+        AUTH_LOOKUPS.labels('success').inc()
+        return credentials
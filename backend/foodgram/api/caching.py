@@ -0,0 +1,323 @@
+"""Двухуровневый кэш для чтений API.
+
+L1 — ограниченный LRU в памяти процесса, L2 — кэш Django
+(API_CACHE_ALIAS), общий для воркеров. Значение берётся через
+``api_cache.get_or_set(key, loader, tags=...)``:
+
+- запросы одного ключа объединяются: в процессе загрузку выполняет один
+  поток, остальные ждут его результата; между процессами загрузку
+  захватывает тот, кто первым добавил ключ блокировки в L2, остальные
+  отдают устаревшее значение или ждут нового;
+- значение перезагружается заранее с вероятностью, растущей к концу
+  срока (XFetch), поэтому популярный ключ не истекает у всех сразу;
+- None кэшируется как отсутствие объекта на API_CACHE_NEGATIVE_TIMEOUT;
+- записи помечаются тегами. ``invalidate(*tags)`` меняет версии тегов в
+  L2 после фиксации транзакции, и записи со старыми версиями считаются
+  промахом. Другие процессы видят новую версию не позже чем через
+  API_CACHE_L1_TIMEOUT секунд.
+
+Инвалидация доходит до других процессов только через общий L2. С
+кэшем в памяти процесса (LocMemCache) api_cache отключён, если не задан
+API_CACHE_ALLOW_LOCAL — это допустимо лишь для единственного процесса
+(runserver, run_benchmark); check_shared_cache сообщает об этом.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from api.metrics import CACHE_EVICTIONS, record_cache
+
+LOCK_POLL_INTERVAL = 0.05
+KEY_PREFIX = 'api'
+# Бэкенды, данные которых не видны другим процессам.
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+Entry = namedtuple('Entry', 'value expires delta versions')
+
+
+class Flight:
+    """Загрузка ключа, которую ждут остальные потоки процесса."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TwoTierCache:
+    def __init__(self):
+        self.local = OrderedDict()
+        self.versions = {}
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    @property
+    def backend(self):
+        return caches[settings.API_CACHE_ALIAS]
+
+    @property
+    def shared(self):
+        return not isinstance(self.backend, LOCAL_BACKENDS)
+
+    @property
+    def enabled(self):
+        return settings.API_CACHE_ENABLED and (
+            self.shared or settings.API_CACHE_ALLOW_LOCAL
+        )
+
+    def get_or_set(self, key, loader, timeout=None, tags=()):
+        """Значение ключа; при промахе — результат loader()."""
+        if not self.enabled:
+            return loader()
+        key = f'{KEY_PREFIX}:{hashlib.md5(key.encode()).hexdigest()}'
+        versions = self.tag_versions(tags)
+        entry = self.read(key, versions)
+        if entry is None:
+            return self.load(key, loader, timeout, versions)
+        if self.expires_early(entry):
+            self.count('early_refreshes')
+            return self.load(key, loader, timeout, versions, stale=entry)
+        return entry.value
+
+    def read(self, key, versions, counted=True):
+        now = time.time()
+        entry = None
+        with self.lock:
+            cached = self.local.get(key)
+            if cached is not None:
+                entry, local_expires = cached
+                if (entry.versions == versions
+                        and min(entry.expires, local_expires) > now):
+                    self.local.move_to_end(key)
+                else:
+                    entry = None
+                    del self.local[key]
+        if entry is not None:
+            if counted:
+                self.count('l1_hits', 'l1', True)
+            return entry
+        if counted:
+            self.count(None, 'l1', False)
+        entry = self.backend.get(key)
+        if entry is not None:
+            entry = Entry(*entry)
+            if entry.versions == versions and entry.expires > now:
+                if counted:
+                    self.count('l2_hits', 'l2', True)
+                self.remember(key, entry)
+                return entry
+        if counted:
+            self.count('misses', 'l2', False)
+        return None
+
+    def expires_early(self, entry):
+        beta = settings.API_CACHE_EARLY_REFRESH_BETA
+        # -log(u) > 0: чем дороже загрузка и ближе срок, тем вероятнее.
+        early = entry.delta * beta * -math.log(1.0 - random.random())
+        return time.time() + early >= entry.expires
+
+    def load(self, key, loader, timeout, versions, stale=None):
+        # Общий срок ожидания чужой загрузки — в процессе и между
+        # процессами вместе, не больше API_CACHE_WAIT_TIMEOUT.
+        deadline = time.monotonic() + settings.API_CACHE_WAIT_TIMEOUT
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            self.count('coalesced')
+            if stale is not None:
+                return stale.value
+            if flight.done.wait(settings.API_CACHE_WAIT_TIMEOUT):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            return loader()
+        try:
+            flight.value = self.load_once(
+                key, loader, timeout, versions, stale, deadline
+            )
+            return flight.value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def load_once(self, key, loader, timeout, versions, stale, deadline):
+        lock_key = f'{key}:lock'
+        locked = self.backend.add(
+            lock_key, 1, settings.API_CACHE_LOCK_TIMEOUT
+        )
+        if not locked:
+            # Ключ загружает другой процесс.
+            if stale is not None:
+                self.count('stale_served')
+                return stale.value
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = self.read(key, versions, counted=False)
+                if entry is not None:
+                    self.count('coalesced')
+                    return entry.value
+            # Не дождались: загружаем сами, чужую блокировку не трогаем.
+            self.count('lock_timeouts')
+        try:
+            started = time.perf_counter()
+            value = loader()
+            delta = time.perf_counter() - started
+            self.count('loads')
+            if value is None:
+                timeout = settings.API_CACHE_NEGATIVE_TIMEOUT
+            elif timeout is None:
+                timeout = settings.API_CACHE_TIMEOUT
+            entry = Entry(value, time.time() + timeout, delta, versions)
+            self.backend.set(key, tuple(entry), timeout)
+            self.remember(key, entry)
+            return value
+        finally:
+            if locked:
+                self.backend.delete(lock_key)
+
+    def remember(self, key, entry):
+        local_expires = time.time() + settings.API_CACHE_L1_TIMEOUT
+        with self.lock:
+            self.local[key] = (entry, local_expires)
+            self.local.move_to_end(key)
+            while len(self.local) > settings.API_CACHE_L1_SIZE:
+                self.local.popitem(last=False)
+                self.counters['evictions'] += 1
+                CACHE_EVICTIONS.inc()
+
+    def tag_versions(self, tags):
+        """Текущие версии тегов; L2 читается не чаще API_CACHE_L1_TIMEOUT."""
+        if not tags:
+            return ()
+        now = time.time()
+        result, missing = {}, []
+        with self.lock:
+            for tag in tags:
+                version, expires = self.versions.get(tag, (None, 0))
+                if expires > now:
+                    result[tag] = version
+                else:
+                    missing.append(tag)
+        if missing:
+            keys = {tag_key(tag): tag for tag in missing}
+            stored = self.backend.get_many(list(keys))
+            for key, tag in keys.items():
+                version = stored.get(key)
+                if version is None:
+                    version = uuid.uuid4().hex
+                    if not self.backend.add(key, version, None):
+                        version = self.backend.get(key, version)
+                result[tag] = version
+            expires = now + settings.API_CACHE_L1_TIMEOUT
+            with self.lock:
+                if len(self.versions) > settings.API_CACHE_L1_SIZE:
+                    self.versions = {
+                        tag: cached for tag, cached in self.versions.items()
+                        if cached[1] > now
+                    }
+                for tag in missing:
+                    self.versions[tag] = (result[tag], expires)
+        return tuple(result[tag] for tag in tags)
+
+    def invalidate(self, *tags):
+        """Сбрасывает записи с тегами после фиксации текущей транзакции."""
+        if self.enabled:
+            transaction.on_commit(lambda: self.bump(tags))
+
+    def bump(self, tags):
+        if not tags:
+            return
+        versions = {tag: uuid.uuid4().hex for tag in tags}
+        self.backend.set_many({
+            tag_key(tag): version
+            for tag, version in versions.items()
+        }, None)
+        expires = time.time() + settings.API_CACHE_L1_TIMEOUT
+        with self.lock:
+            for tag, version in versions.items():
+                self.versions[tag] = (version, expires)
+
+    def count(self, name, level=None, hit=None):
+        if name is not None:
+            with self.lock:
+                self.counters[name] += 1
+        if level is not None:
+            record_cache(level, hit)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            entries = len(self.local)
+        requests = (counters.get('l1_hits', 0) + counters.get('l2_hits', 0)
+                    + counters.get('misses', 0))
+        hits = requests - counters.get('misses', 0)
+        return {
+            'l1_hits': counters.get('l1_hits', 0),
+            'l2_hits': counters.get('l2_hits', 0),
+            'misses': counters.get('misses', 0),
+            'hit_ratio': round(hits / requests, 4) if requests else None,
+            'loads': counters.get('loads', 0),
+            'early_refreshes': counters.get('early_refreshes', 0),
+            'coalesced': counters.get('coalesced', 0),
+            'stale_served': counters.get('stale_served', 0),
+            'lock_timeouts': counters.get('lock_timeouts', 0),
+            'evictions': counters.get('evictions', 0),
+            'enabled': self.enabled,
+            'shared': self.shared,
+            'l1_entries': entries,
+            'l1_size': settings.API_CACHE_L1_SIZE,
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters.clear()
+
+    def clear_local(self):
+        with self.lock:
+            self.local.clear()
+            self.versions.clear()
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if not settings.API_CACHE_ENABLED or api_cache.shared:
+        return []
+    if settings.API_CACHE_ALLOW_LOCAL:
+        return [checks.Warning(
+            'L2 api_cache хранится в памяти процесса: инвалидация не '
+            'дойдёт до других воркеров и run_workers.',
+            hint='Допустимо только для одного процесса; для нескольких '
+                 'задайте CACHE_BACKEND и CACHE_LOCATION (memcached).',
+            id='api.W002',
+        )]
+    return [checks.Warning(
+        'api_cache отключён: кэш API_CACHE_ALIAS не общий для процессов.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION (memcached) или '
+             'API_CACHE_ALLOW_LOCAL=True для единственного процесса.',
+        id='api.W001',
+    )]
+
+
+def tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{hashlib.md5(tag.encode()).hexdigest()}'
+
+
+api_cache = TwoTierCache()
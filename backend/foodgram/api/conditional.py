@@ -0,0 +1,58 @@
+"""Условные GET-запросы (ETag / Last-Modified) для рецептов.
+
+Валидаторы строятся по дешёвым watermark-ам, без сериализации: по
+максимальному Recipe.updated_at и числу рецептов выборки (удаление
+рецепта меняет число) и по User.interactions_changed_at — времени
+последнего изменения избранного, корзины или подписок пользователя.
+Просмотры (views_count) в валидаторы не входят: счётчик и так
+обновляется с задержкой.
+
+Last-Modified отдаётся только для одного рецепта. У списка дата с
+точностью до секунды не меняется при удалении старого рецепта или двух
+правках за секунду, поэтому список проверяется только по ETag.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+
+class Validators:
+    def __init__(self, request, last_modified, *parts, dated=True):
+        user = request.user
+        stamps = [last_modified]
+        if user.is_authenticated:
+            stamps.append(user.interactions_changed_at)
+        stamps = [stamp for stamp in stamps if stamp is not None]
+        self.last_modified = (
+            int(max(stamps).timestamp()) if stamps and dated else None
+        )
+        key = repr((
+            user.pk, [stamp.isoformat() for stamp in stamps],
+            request.get_full_path(), request.accepted_media_type, *parts,
+        ))
+        self.etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    @classmethod
+    def for_queryset(cls, request, queryset):
+        watermark = queryset.order_by().aggregate(
+            last_modified=Max('updated_at'), count=Count('pk')
+        )
+        return cls(request, watermark['last_modified'], watermark['count'],
+                   dated=False)
+
+    def not_modified(self, request):
+        """Ответ 304, если у клиента актуальная версия, иначе None."""
+        return get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
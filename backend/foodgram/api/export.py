@@ -0,0 +1,167 @@
+"""Выгрузка данных пользователя ZIP-архивом, который собирается на лету.
+
+Архив пишется в ZipStream, откуда генератор сразу отдаёт готовые байты
+клиенту: ни архив целиком, ни отдельный файл не хранятся в памяти или на
+диске. JSON-файлы формируются порциями по EXPORT_CHUNK_SIZE записей,
+изображения читаются из хранилища блоками по EXPORT_BLOCK_SIZE байт.
+"""
+import io
+import json
+import os
+import time
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+from users.models import User
+
+EXPORT_CHUNK_SIZE = 200
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+
+class ZipStream(io.RawIOBase):
+    """Файл только для записи, из которого забираются записанные байты."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def chunked(queryset, size=EXPORT_CHUNK_SIZE):
+    """Порции queryset по первичному ключу без OFFSET."""
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def json_array(chunks, serialize):
+    yield b'['
+    separator = b'\n'
+    for chunk in chunks:
+        for obj in chunk:
+            yield separator + json.dumps(
+                serialize(obj), ensure_ascii=False
+            ).encode()
+            separator = b',\n'
+    yield b'\n]\n'
+
+
+def image_path(name):
+    return f'images/{os.path.basename(name)}' if name else None
+
+
+def serialize_recipe(recipe):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': image_path(recipe.image.name),
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingr.all()
+        ],
+    }
+
+
+def serialize_recipe_link(recipe):
+    return {'id': recipe.id, 'name': recipe.name}
+
+
+def serialize_author(author):
+    return {
+        'id': author.id,
+        'username': author.username,
+        'first_name': author.first_name,
+        'last_name': author.last_name,
+    }
+
+
+def export_files(user):
+    """Пары (имя файла в архиве, итератор байтов)."""
+    recipes = Recipe.objects.filter(author=user).prefetch_related(
+        'tags',
+        Prefetch('recipe_ingr', queryset=RecipeIngredient.objects
+                 .select_related('ingredient').order_by('pk')),
+    )
+    profile = {
+        'id': user.id,
+        'email': user.email,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined.isoformat(),
+    }
+    yield 'profile.json', [
+        json.dumps(profile, ensure_ascii=False, indent=2).encode()
+    ]
+    yield 'recipes.json', json_array(chunked(recipes), serialize_recipe)
+    yield 'favorites.json', json_array(chunked(
+        Recipe.objects.filter(favorites__user=user).only('id', 'name')
+    ), serialize_recipe_link)
+    yield 'shopping_list.json', json_array(chunked(
+        Recipe.objects.filter(shopping__user=user).only('id', 'name')
+    ), serialize_recipe_link)
+    yield 'subscriptions.json', json_array(chunked(
+        User.objects.filter(author__user=user)
+    ), serialize_author)
+
+    exported = set()
+    images = Recipe.objects.filter(author=user).exclude(image='')
+    for chunk in chunked(images.only('id', 'image')):
+        for recipe in chunk:
+            name = recipe.image.name
+            if name in exported or not default_storage.exists(name):
+                continue
+            exported.add(name)
+            yield image_path(name), read_blocks(name)
+
+
+def read_blocks(name):
+    with default_storage.open(name) as file:
+        while True:
+            block = file.read(EXPORT_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def stream_export(user):
+    """Генератор байтов ZIP-архива с данными пользователя."""
+    stream = ZipStream()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for name, blocks in export_files(user):
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as entry:
+                for block in blocks:
+                    entry.write(block)
+                    data = stream.drain()
+                    if data:
+                        yield data
+    yield stream.drain()
@@ -1,14 +1,41 @@
 import django_filters
+from django import forms
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Lower
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import FavoritesList, Ingredient, Recipe, ShoppingList
+from recipes.search import search
+from recipes.tag_map import tag_ids_by_slug
+from users.models import User
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+
+
+class SlugListField(forms.Field):
+    """Список значений из повторяющегося параметра: ?tags=a&tags=b."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [item for item in value or [] if item]
+
+
+class SlugListFilter(filters.Filter):
+    field_class = SlugListField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = SlugListFilter(
+        method='get_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=[(TAGS_MODE_ANY, TAGS_MODE_ANY),
+                 (TAGS_MODE_ALL, TAGS_MODE_ALL)],
+        method='get_tags_mode'
+    )
+    name = filters.CharFilter(
+        method='get_name'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -16,28 +43,93 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    ordering = filters.OrderingFilter(
+        fields=[('pub_date', 'pub_date'), ('views', 'views_count')]
+    )
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        # name — после остальных фильтров: поиск отбирает SEARCH_LIMIT
+        # лучших совпадений из уже отфильтрованных рецептов.
+        fields = ['tags', 'tags_mode', 'author', 'is_favorited',
+                  'is_in_shopping_cart', 'name', 'ordering']
 
-    def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorites__user=self.request.user)
+    def get_tags(self, queryset, name, value):
+        """Фильтр по тегам через EXISTS, без JOIN и дублей рецептов.
+
+        В режиме any (по умолчанию) рецепт должен иметь хотя бы один из
+        тегов, в режиме all — все перечисленные.
+        """
+        if not value:
+            return queryset
+        slugs = set(value)
+        tag_ids = tag_ids_by_slug(slugs)
+        mode = self.form.cleaned_data.get('tags_mode') or TAGS_MODE_ANY
+        if not tag_ids or (mode == TAGS_MODE_ALL
+                           and len(tag_ids) < len(slugs)):
+            return queryset.none()
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        if mode == TAGS_MODE_ANY:
+            return queryset.filter(
+                Exists(recipe_tags.filter(tag_id__in=tag_ids))
+            )
+        for tag_id in tag_ids:
+            queryset = queryset.filter(
+                Exists(recipe_tags.filter(tag_id=tag_id))
+            )
         return queryset
 
-    def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping__user=self.request.user)
+    def get_tags_mode(self, queryset, name, value):
         return queryset
 
+    def get_name(self, queryset, name, value):
+        """Нечёткий поиск по названию, лучшие совпадения первыми."""
+        return search(queryset, value)
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_user_list(queryset, FavoritesList, value)
+
+    def get_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_list(queryset, ShoppingList, value)
+
+    def filter_user_list(self, queryset, model, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe_id=OuterRef('pk')
+        )))
+
 
 class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith'
-    )
+    name = django_filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        return search(queryset, value)
+
+
+class UserFilter(django_filters.FilterSet):
+    search = django_filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = User
+        fields = ['search']
+
+    def filter_search(self, queryset, name, value):
+        # Префиксный поиск по индексам user_username_lower_prefix_idx и
+        # user_email_lower_prefix_idx.
+        value = value.lower()
+        return queryset.annotate(
+            username_lower=Lower('username'), email_lower=Lower('email')
+        ).filter(
+            Q(username_lower__startswith=value)
+            | Q(email_lower__startswith=value)
+        )
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+
+
+class QueryTimer:
+    """Обёртка для connection.execute_wrapper, считающая запросы и время.
+
+    В отличие от connection.queries не хранит текст запросов, поэтому
+    память не растёт с количеством запросов.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class SerializationTimingMixin:
+    """Замеряет сериализацию ответа для RequestTimingMiddleware.
+
+    Класс сериализатора view заменяется подклассом, который засекает
+    to_representation (из него строится .data, включая вложенные
+    сериализаторы) и прибавляет время к request._serialize_time.
+    """
+
+    def get_serializer_class(self):
+        serializer_class = super().get_serializer_class()
+        if not settings.REQUEST_TIMING_ENABLED:
+            return serializer_class
+        return timed_serializer(serializer_class)
+
+
+@lru_cache(maxsize=None)
+def timed_serializer(serializer_class):
+    class TimedSerializer(serializer_class):
+        def to_representation(self, instance):
+            started = time.perf_counter()
+            try:
+                return super().to_representation(instance)
+            finally:
+                request = getattr(
+                    self.context.get('request'), '_request', None
+                )
+                if hasattr(request, '_serialize_time'):
+                    request._serialize_time += (
+                        time.perf_counter() - started
+                    )
+
+    TimedSerializer.__name__ = serializer_class.__name__
+    TimedSerializer.__qualname__ = serializer_class.__qualname__
+    TimedSerializer.__module__ = serializer_class.__module__
+    return TimedSerializer
+
+
+class RouteStats:
+    """Скользящая статистика запросов по маршрутам в пределах процесса."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def add(self, route, total, sql, queries, render, serialize=0.0):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    'count': 0, 'total': 0.0, 'sql': 0.0, 'queries': 0,
+                    'render': 0.0, 'serialize': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self.window),
+                }
+            stats['count'] += 1
+            stats['total'] += total
+            stats['sql'] += sql
+            stats['queries'] += queries
+            stats['render'] += render
+            stats['serialize'] += serialize
+            stats['max'] = max(stats['max'], total)
+            stats['recent'].append(total)
+
+    def snapshot(self):
+        with self.lock:
+            routes = {
+                route: dict(stats, recent=sorted(stats['recent']))
+                for route, stats in self.routes.items()
+            }
+        return {
+            route: {
+                'count': stats['count'],
+                'avg_ms': round(stats['total'] / stats['count'] * 1000, 2),
+                'avg_sql_ms': round(stats['sql'] / stats['count'] * 1000, 2),
+                'avg_queries': round(stats['queries'] / stats['count'], 2),
+                'avg_render_ms': round(
+                    stats['render'] / stats['count'] * 1000, 2
+                ),
+                'avg_serialize_ms': round(
+                    stats['serialize'] / stats['count'] * 1000, 2
+                ),
+                'max_ms': round(stats['max'] * 1000, 2),
+                'p50_ms': percentile_ms(stats['recent'], 0.50),
+                'p95_ms': percentile_ms(stats['recent'], 0.95),
+                'p99_ms': percentile_ms(stats['recent'], 0.99),
+            }
+            for route, stats in routes.items()
+        }
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+def percentile_ms(ordered, share):
+    index = min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))
+    return round(ordered[index] * 1000, 2)
+
+
+route_stats = RouteStats(settings.REQUEST_TIMING_WINDOW)
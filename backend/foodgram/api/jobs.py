@@ -0,0 +1,186 @@
+"""Очередь фоновых задач на таблице api.Job.
+
+Задача — функция, зарегистрированная декоратором ``@task``; ставится в
+очередь через ``enqueue`` и выполняется командой ``run_workers``.
+Воркер забирает задачу через SELECT ... FOR UPDATE SKIP LOCKED там, где
+база это поддерживает (PostgreSQL), иначе — условным UPDATE, который
+удаётся только одному воркеру. Неудачные задачи повторяются с
+экспоненциальной задержкой, после max_attempts попыток остаются в
+статусе dead. Завершённые задачи (done и dead) удаляются через
+JOB_RETENTION секунд.
+"""
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Job
+
+logger = logging.getLogger('api.jobs')
+
+TASKS = {}
+PRUNE_BATCH_SIZE = 1000
+_claim_lock = threading.Lock()
+_current = threading.local()
+
+
+def task(func=None, *, name=None):
+    """Регистрирует функцию как фоновую задачу."""
+    def register(func):
+        TASKS[name or func.__name__] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(task_name, user=None, max_attempts=None, delay=None, **payload):
+    # Не name: этот аргумент нужен задачам (generate_image_variants).
+    if task_name not in TASKS:
+        raise LookupError(f'Неизвестная задача: {task_name}')
+    return Job.objects.create(
+        name=task_name,
+        payload=payload,
+        user=user,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+
+
+def claim_job(worker_id):
+    queued = Job.objects.filter(
+        status__in=[Job.QUEUED, Job.FAILED], run_at__lte=timezone.now()
+    ).order_by('run_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queued.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            return lock_job(job, worker_id, Job.objects.filter(pk=job.pk))
+    with _claim_lock:
+        job = queued.first()
+        if job is None:
+            return None
+        return lock_job(job, worker_id, Job.objects.filter(
+            pk=job.pk, status=job.status, attempts=job.attempts
+        ))
+
+
+def lock_job(job, worker_id, queryset):
+    now = timezone.now()
+    claimed = queryset.update(
+        status=Job.RUNNING, locked_at=now, locked_by=worker_id,
+        attempts=job.attempts + 1, updated_at=now,
+    )
+    if not claimed:
+        return None
+    job.status, job.locked_at, job.locked_by = Job.RUNNING, now, worker_id
+    job.attempts += 1
+    return job
+
+
+def report_progress(**progress):
+    """Сохраняет промежуточный результат выполняемой задачи."""
+    job = getattr(_current, 'job', None)
+    if job is not None:
+        Job.objects.filter(pk=job.pk).update(
+            result={'progress': progress}, updated_at=timezone.now()
+        )
+
+
+def execute_job(job):
+    func = TASKS.get(job.name)
+    _current.job = job
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        result = func(**job.payload)
+    except Exception:
+        fail_job(job, traceback.format_exc())
+        return False
+    finally:
+        _current.job = None
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, result=result, error='', updated_at=timezone.now()
+    )
+    return True
+
+
+def fail_job(job, error):
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        status, run_at = Job.DEAD, job.run_at
+        logger.error('Задача %s #%s не выполнена: %s',
+                     job.name, job.pk, error)
+    else:
+        status = Job.FAILED
+        run_at = now + timedelta(
+            seconds=settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        )
+        logger.warning('Задача %s #%s будет повторена в %s',
+                       job.name, job.pk, run_at)
+    Job.objects.filter(pk=job.pk).update(
+        status=status, run_at=run_at, error=error, updated_at=now
+    )
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи воркеров, завершившихся аварийно.
+
+    Задачи, исчерпавшие max_attempts, не повторяются, а становятся dead.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT),
+    )
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.DEAD, error='Воркер не завершил последнюю попытку',
+        updated_at=now,
+    )
+    if dead:
+        logger.error('Задач без повторов после сбоя воркера: %s', dead)
+    return stale.update(status=Job.FAILED, run_at=now, updated_at=now)
+
+
+def prune_jobs():
+    """Удаляет завершённые задачи старше JOB_RETENTION порциями.
+
+    Возвращает количество удалённых задач.
+    """
+    finished = Job.objects.filter(
+        status__in=[Job.DONE, Job.DEAD],
+        updated_at__lt=timezone.now() - timedelta(
+            seconds=settings.JOB_RETENTION
+        ),
+    )
+    total = 0
+    while True:
+        ids = list(finished.values_list('pk', flat=True)[:PRUNE_BATCH_SIZE])
+        if not ids:
+            return total
+        total += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def run_worker(worker_id, stop_event, poll_interval, burst=False):
+    """Выполняет задачи, пока не установлен stop_event.
+
+    В режиме burst завершается, как только очередь пуста.
+    """
+    try:
+        while not stop_event.is_set():
+            # Как между HTTP-запросами: закрыть устаревшее соединение и
+            # проверить постоянное перед повторным использованием.
+            close_old_connections()
+            job = claim_job(worker_id)
+            if job is not None:
+                execute_job(job)
+            elif burst:
+                return
+            else:
+                stop_event.wait(poll_interval)
+    finally:
+        connection.close()
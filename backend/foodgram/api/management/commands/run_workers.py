@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import prune_jobs, requeue_stale_jobs, run_worker
+
+logger = logging.getLogger('api.jobs')
+
+STALE_CHECK_INTERVAL = 60
+
+
+def run_process(threads, poll_interval, burst):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    workers = [
+        threading.Thread(
+            target=run_worker,
+            args=(f'{prefix}:{number}', stop_event, poll_interval, burst),
+        )
+        for number in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    checked = time.monotonic()
+    while any(worker.is_alive() for worker in workers):
+        if stop_event.wait(poll_interval):
+            break
+        if time.monotonic() - checked > STALE_CHECK_INTERVAL:
+            checked = time.monotonic()
+            requeue_stale_jobs()
+            prune_jobs()
+            connections.close_all()
+    for worker in workers:
+        worker.join()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Количество процессов'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Количество потоков в каждом процессе'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди, в секундах'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Завершиться, когда очередь опустеет'
+        )
+
+    def handle(self, *args, **options):
+        requeue_stale_jobs()
+        prune_jobs()
+        arguments = (options['threads'], options['poll_interval'],
+                     options['burst'])
+        if options['processes'] == 1:
+            run_process(*arguments)
+            return
+        # Соединения с базой не должны наследоваться дочерними процессами.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_process, args=arguments)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(*args):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
+        logger.info('Воркеры остановлены')
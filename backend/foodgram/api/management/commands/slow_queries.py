@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from api.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Самые затратные медленные запросы по суммарному времени.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Количество запросов в отчёте'
+        )
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Показать план выполнения запросов'
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Очистить журнал медленных запросов'
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено записей: {deleted}'
+            ))
+            return
+        queries = SlowQuery.objects.order_by('-total_time')
+        for number, query in enumerate(queries[:options['limit']], 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{number}. {query.origin}: {query.total_time:.1f} мс '
+                f'всего, {query.calls} вызовов, '
+                f'{query.total_time / query.calls:.1f} мс в среднем, '
+                f'максимум {query.max_time:.1f} мс'
+            ))
+            self.stdout.write(query.sql)
+            if query.stack:
+                self.stdout.write(query.stack)
+            if options['explain'] and query.explain:
+                self.stdout.write(query.explain)
+            self.stdout.write('')
@@ -0,0 +1,62 @@
+"""Метрики приложения в формате Prometheus.
+
+При запуске под gunicorn с несколькими воркерами задайте переменную
+окружения PROMETHEUS_MULTIPROC_DIR: каждый процесс пишет значения в
+mmap-файлы этого каталога, а /api/metrics суммирует их при чтении.
+"""
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_latency_seconds',
+    'Время обработки запроса по view и action.',
+    ['view', 'action', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'Количество SQL-запросов на один HTTP-запрос.',
+    ['view', 'action'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, float('inf')),
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшу по результату (hit/miss).',
+    ['cache', 'result'],
+)
+CACHE_EVICTIONS = Counter(
+    'foodgram_cache_evictions_total',
+    'Записи, вытесненные из кэша процесса (L1) по размеру.',
+)
+AUTH_LOOKUPS = Counter(
+    'foodgram_auth_lookups_total',
+    'Проверки токенов аутентификации по результату.',
+    ['result'],
+)
+THROTTLED_REQUESTS = Counter(
+    'foodgram_throttled_requests_total',
+    'Запросы, отклонённые ограничением частоты, по области.',
+    ['scope'],
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных изображений после декодирования base64.',
+    buckets=(16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+             4 * 1024 * 1024, 16 * 1024 * 1024, float('inf')),
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """Возвращает метрики всех процессов в текстовом формате."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,220 @@
+import cProfile
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.instrumentation import QueryTimer, route_stats
+from api.metrics import REQUEST_LATENCY, REQUEST_QUERIES
+from api.profiling import StackSampler, save_profile
+from api.slow_queries import SlowQueryRecorder
+
+logger = logging.getLogger('api.timing')
+
+
+def query_timer_context(timer):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+    return stack
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class RequestTimingMiddleware:
+    """Замеряет время запроса, SQL, сериализации и рендеринга ответа.
+
+    Сериализация (.data сериализаторов view с SerializationTimingMixin)
+    и рендеринг (response.render()) вычитаются из времени view.
+
+    Результаты отдаются в заголовке Server-Timing, пишутся в лог
+    api.timing и копятся в api.instrumentation.route_stats. Если
+    REQUEST_TIMING_ENABLED выключен, middleware исключается из цепочки
+    при старте и ничего не стоит.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._render_time = 0.0
+        request._serialize_time = 0.0
+        started = time.perf_counter()
+        with query_timer_context(timer):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        render = request._render_time
+        serialize = request._serialize_time
+        view = total - render - serialize
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timer.duration * 1000:.2f};desc="{timer.count} queries"',
+            f'view;dur={view * 1000:.2f}',
+            f'serialize;dur={serialize * 1000:.2f}',
+            f'render;dur={render * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        route = route_name(request)
+        route_stats.add(
+            route, total, timer.duration, timer.count, render, serialize
+        )
+        logger.info(json.dumps({
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'view_ms': round(view * 1000, 2),
+            'serialize_ms': round(serialize * 1000, 2),
+            'render_ms': round(render * 1000, 2),
+            'sql_ms': round(timer.duration * 1000, 2),
+            'queries': timer.count,
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        """Засекает рендеринг DRF-ответа, который идёт после view."""
+        started = time.perf_counter()
+
+        def finished(rendered):
+            request._render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(finished)
+        return response
+
+
+class MetricsMiddleware:
+    """Собирает метрики Prometheus по DRF view и action.
+
+    Включается настройкой METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._metrics_view = ('unresolved', request.method.lower())
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with query_timer_context(timer):
+            response = self.get_response(request)
+        view, action = request._metrics_view
+        REQUEST_LATENCY.labels(
+            view, action, request.method, response.status_code
+        ).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(view, action).observe(timer.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            view = getattr(view_func, '__name__', 'unknown')
+        else:
+            view = view_class.__name__
+        actions = getattr(view_func, 'actions', None) or {}
+        method = request.method.lower()
+        request._metrics_view = (view, actions.get(method, method))
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос через cProfile и семплер стеков.
+
+    Запускается по заголовку X-Profile или параметру ?profile=1 от
+    сотрудника, а также для каждого PROFILING_SAMPLE_RATE-го запроса в
+    среднем. Результаты смотрятся через /api/profiles/.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profile = cProfile.Profile()
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL
+        )
+        sampler.start()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+            sampler.stop()
+        name = save_profile(
+            profile, sampler, f'{request.method}-{route_name(request)}',
+            time.perf_counter() - started
+        )
+        response['X-Profile-Id'] = name
+        return response
+
+    def should_profile(self, request):
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.randrange(rate) == 0:
+            return True
+        if not (request.headers.get('X-Profile')
+                or request.GET.get('profile')):
+            return False
+        return self.is_staff(request)
+
+    @staticmethod
+    def is_staff(request):
+        """Проверяет права так же, как DRF: по токену или сессии."""
+        if request.user.is_staff:
+            return True
+        drf_request = Request(request, authenticators=[
+            authenticator() for authenticator
+            in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        try:
+            return drf_request.user.is_staff
+        except APIException:
+            return False
+
+
+class SlowQueryMiddleware:
+    """Пишет запросы дольше SLOW_QUERY_THRESHOLD_MS в журнал SlowQuery.
+
+    Отключён, если порог не задан. Сводка: manage.py slow_queries.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorders = [
+            SlowQueryRecorder(
+                connection.alias, settings.SLOW_QUERY_THRESHOLD_MS
+            )
+            for connection in connections.all()
+        ]
+        with ExitStack() as stack:
+            for connection, recorder in zip(connections.all(), recorders):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        for recorder in recorders:
+            recorder.save()
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True, verbose_name='Отпечаток')),
+                ('sql', models.TextField(verbose_name='Пример запроса')),
+                ('origin', models.CharField(blank=True, max_length=255, verbose_name='Источник')),
+                ('stack', models.TextField(blank=True, verbose_name='Стек вызовов')),
+                ('explain', models.TextField(blank=True, verbose_name='План запроса')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='Количество вызовов')),
+                ('total_time', models.FloatField(default=0, verbose_name='Суммарное время, мс')),
+                ('max_time', models.FloatField(default=0, verbose_name='Максимальное время, мс')),
+                ('last_seen', models.DateTimeField(auto_now=True, verbose_name='Последний вызов')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-total_time'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-19 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0002_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
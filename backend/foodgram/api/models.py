@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class SlowQuery(models.Model):
+    fingerprint = models.CharField(
+        verbose_name='Отпечаток',
+        max_length=40,
+        unique=True
+    )
+    sql = models.TextField(
+        verbose_name='Пример запроса'
+    )
+    origin = models.CharField(
+        verbose_name='Источник',
+        max_length=255,
+        blank=True
+    )
+    stack = models.TextField(
+        verbose_name='Стек вызовов',
+        blank=True
+    )
+    explain = models.TextField(
+        verbose_name='План запроса',
+        blank=True
+    )
+    calls = models.PositiveIntegerField(
+        verbose_name='Количество вызовов',
+        default=0
+    )
+    total_time = models.FloatField(
+        verbose_name='Суммарное время, мс',
+        default=0
+    )
+    max_time = models.FloatField(
+        verbose_name='Максимальное время, мс',
+        default=0
+    )
+    last_seen = models.DateTimeField(
+        verbose_name='Последний вызов',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ['-total_time']
+
+    def __str__(self):
+        return f'{self.origin} {self.total_time:.0f} мс'
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    DEAD = 'dead'
+    STATUSES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка, будет повтор'),
+        (DEAD, 'Ошибка, повторов не будет'),
+    ]
+
+    name = models.CharField(
+        verbose_name='Задача',
+        max_length=100
+    )
+    payload = models.JSONField(
+        verbose_name='Параметры',
+        default=dict
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='jobs',
+        verbose_name='Пользователь',
+        null=True,
+        blank=True
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток',
+        default=5
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Запустить после',
+        default=timezone.now
+    )
+    locked_at = models.DateTimeField(
+        verbose_name='Взята в работу',
+        null=True,
+        blank=True
+    )
+    locked_by = models.CharField(
+        verbose_name='Воркер',
+        max_length=100,
+        blank=True
+    )
+    result = models.JSONField(
+        verbose_name='Результат',
+        null=True,
+        blank=True
+    )
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Создана',
+        auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Обновлена',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'], name='job_status_run_at_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} {self.status}'
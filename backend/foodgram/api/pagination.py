@@ -4,3 +4,4 @@ from rest_framework.pagination import PageNumberPagination
 class PageCustPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    max_page_size = 100
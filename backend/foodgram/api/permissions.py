@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -11,3 +14,23 @@ class IsAdminAuthorOrReadOnly(permissions.BasePermission):
                 or request.user.is_superuser
                 or request.user.is_staff
                 or obj.author == request.user)
+
+
+class CanScrapeMetrics(permissions.BasePermission):
+    """Доступ к метрикам: администратор, токен METRICS_TOKEN
+    (Authorization: Bearer) или адрес из METRICS_ALLOWED_IPS.
+
+    Адрес берётся из REMOTE_ADDR, а не из X-Forwarded-For, который
+    клиент может подставить сам.
+    """
+
+    def has_permission(self, request, view):
+        if request.user.is_staff:
+            return True
+        if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+            return True
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and hmac.compare_digest(
+            header.encode(), f'Bearer {token}'.encode()
+        )
@@ -0,0 +1,97 @@
+"""Профилирование отдельных запросов.
+
+Для каждого запроса сохраняются два файла с общим именем: ``.prof``
+(pstats, открывается snakeviz или ``python -m pstats``) и ``.folded``
+(стеки в формате collapsed stack для flamegraph.pl и speedscope).
+Каталог PROFILING_DIR ограничен PROFILING_MAX_FILES профилями: старые
+удаляются при сохранении новых.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+PROFILE_NAME = re.compile(r'^[\w.-]+$')
+EXTENSIONS = ('.prof', '.folded')
+
+
+class StackSampler(threading.Thread):
+    """Периодически снимает стек указанного потока."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{os.path.basename(code.co_filename)}:{code.co_name}'
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def folded(self):
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+def save_profile(profile, sampler, label, duration):
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    name = '{}-{}-{}ms'.format(
+        time.strftime('%Y%m%d-%H%M%S'),
+        re.sub(r'[^\w.-]+', '_', label)[:80],
+        int(duration * 1000),
+    )
+    base = os.path.join(settings.PROFILING_DIR, name)
+    profile.dump_stats(base + '.prof')
+    with open(base + '.folded', 'w', encoding='utf-8') as file:
+        file.write(sampler.folded())
+    rotate_profiles()
+    return name
+
+
+def list_profiles():
+    """Профили от новых к старым."""
+    try:
+        files = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    names = {
+        os.path.splitext(file)[0] for file in files
+        if file.endswith(EXTENSIONS)
+    }
+    return sorted(names, reverse=True)
+
+
+def rotate_profiles():
+    for name in list_profiles()[settings.PROFILING_MAX_FILES:]:
+        for extension in EXTENSIONS:
+            try:
+                os.remove(os.path.join(settings.PROFILING_DIR,
+                                       name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def profile_path(name, extension):
+    if not PROFILE_NAME.match(name) or extension not in EXTENSIONS:
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name + extension)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,89 @@
+"""Файлы, доступные только владельцу: выгрузки списков покупок и данных.
+
+Файлы лежат в PROTECTED_MEDIA_ROOT в каталоге ``<id пользователя>/``,
+вне MEDIA_ROOT, и не раздаются nginx напрямую. Django только проверяет
+права и отвечает заголовком X-Accel-Redirect на внутренний location
+PROTECTED_MEDIA_URL, содержимое отдаёт nginx. Без PROTECTED_MEDIA_ACCEL
+(локальная разработка) файл отдаётся самим Django.
+
+Файл удаляется через PROTECTED_FILE_TTL секунд после создания
+отложенной задачей delete_protected_file.
+"""
+import os
+import uuid
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+
+protected_storage = FileSystemStorage(
+    location=settings.PROTECTED_MEDIA_ROOT,
+    base_url=settings.PROTECTED_MEDIA_URL,
+)
+
+
+def save_protected(user_id, filename, content):
+    """Сохраняет файл пользователя и возвращает его имя в хранилище.
+
+    Удаление файла по истечении PROTECTED_FILE_TTL ставится в очередь.
+    """
+    from api.jobs import enqueue
+
+    name = f'{user_id}/{uuid.uuid4().hex}/{filename}'
+    if isinstance(content, str):
+        content = content.encode()
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    name = protected_storage.save(name, content)
+    enqueue('delete_protected_file', name=name,
+            delay=timedelta(seconds=settings.PROTECTED_FILE_TTL))
+    return name
+
+
+def delete_protected(name):
+    """Удаляет файл и опустевшие каталоги над ним."""
+    protected_storage.delete(name)
+    directory = os.path.dirname(name)
+    while directory:
+        try:
+            os.rmdir(protected_storage.path(directory))
+        except OSError:
+            # Каталог не пуст или уже удалён.
+            return
+        directory = os.path.dirname(directory)
+
+
+def protected_url(name):
+    return reverse('protected-file', kwargs={'path': name})
+
+
+def is_owner(user, name):
+    return user.is_staff or name.split('/', 1)[0] == str(user.pk)
+
+
+def protected_response(name):
+    """Ответ с файлом; None, если имя некорректно или файла нет."""
+    path = os.path.normpath(name)
+    if path != name or path.startswith(('/', '..')):
+        return None
+    if not protected_storage.exists(name):
+        return None
+    filename = os.path.basename(name)
+    if not settings.PROTECTED_MEDIA_ACCEL:
+        return FileResponse(
+            protected_storage.open(name), as_attachment=True,
+            filename=filename
+        )
+    response = HttpResponse()
+    # Тип содержимого nginx определит по расширению.
+    del response['Content-Type']
+    response['X-Accel-Redirect'] = quote(protected_storage.url(name))
+    response['Content-Disposition'] = (
+        f"attachment; filename*=UTF-8''{quote(filename)}"
+    )
+    response['Cache-Control'] = 'private, no-cache'
+    return response
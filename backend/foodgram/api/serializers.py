@@ -1,25 +1,62 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.metrics import IMAGE_UPLOAD_BYTES
+from api.models import Job
+from recipes.cards import refresh_card
+from recipes.duplicates import (features, find_similar, minhash,
+                                store_signatures)
+from recipes.images import (ImageError, PreparedImage, decode_base64,
+                            delete_unused_images, image_variants)
 from recipes.models import (FavoritesList, Ingredient, Recipe,
                             RecipeIngredient, ShoppingList, Tag)
 from users.models import Subscription, User
 
 
 class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(
-                base64.b64decode(imgstr), name='temp.' + ext
-            )
+    """Изображение в base64 или файлом; см. recipes.images.
 
-        return super().to_internal_value(data)
+    Возвращает проверенный PreparedImage: файлы записываются при
+    сохранении рецепта, а не при валидации, и повторная загрузка того же
+    изображения не создаёт новых файлов.
+    """
+
+    def to_internal_value(self, data):
+        max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+        try:
+            if isinstance(data, str) and data.startswith('data:image'):
+                content = decode_base64(
+                    data.partition(';base64,')[2], max_size
+                )
+            elif hasattr(data, 'read'):
+                if data.size > max_size:
+                    raise ImageError('Изображение слишком большое.')
+                content = data.read()
+            else:
+                self.fail('invalid')
+            IMAGE_UPLOAD_BYTES.observe(len(content))
+            return PreparedImage(content)
+        except ImageError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class ImageSrcsetMixin:
+    """Добавляет image_srcset с URL уменьшенных WebP-копий."""
+
+    def get_image_srcset(self, obj):
+        request = self.context.get('request')
+        urls = []
+        for width, name in image_variants(
+                obj.image.name, obj.image_width).items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls.append(f'{url} {width}w')
+        return ', '.join(urls)
 
 
 class SignUpSerializer(UserCreateSerializer):
@@ -38,6 +75,9 @@ class CustUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed']
 
     def get_is_subscribed(self, obj):
+        # CustUserViewSet аннотирует is_subscribed подзапросом.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request.user.is_authenticated
                 and Subscription.objects.filter(
@@ -82,14 +122,15 @@ class RecipeIngredientPostSerializer(serializers.ModelSerializer):
         fields = ['id', 'amount']
 
 
-class InfoRecipeSerializer(serializers.ModelSerializer):
+class InfoRecipeSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_srcset', 'cooking_time']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     author = CustUserSerializer()
     tags = TagSerializer(many=True)
     ingredients = RecipeIngredientSerializer(
@@ -97,12 +138,14 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    views_count = serializers.IntegerField(source='views', read_only=True)
 
     class Meta:
         model = Recipe
         fields = ['id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time']
+                  'is_in_shopping_cart', 'name', 'image', 'image_srcset',
+                  'text', 'cooking_time', 'views_count']
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
@@ -143,7 +186,39 @@ class RecipePostSerializer(serializers.ModelSerializer):
             )
         return ingredients
 
+    def save(self, **kwargs):
+        """Сохраняет рецепт и убирает ненужные файлы изображений.
+
+        Если сохранение не удалось, стираются только что записанные
+        файлы; заменённое изображение — после фиксации транзакции, если
+        на него больше не ссылаются.
+        """
+        image = self.validated_data.get('image')
+        old_image = self.instance.image.name if (
+            self.instance is not None and image is not None
+        ) else None
+        try:
+            recipe = super().save(**kwargs)
+        except Exception:
+            if image is not None:
+                image.discard()
+            raise
+        if old_image and old_image != recipe.image.name:
+            transaction.on_commit(
+                lambda: delete_unused_images([old_image])
+            )
+        return recipe
+
+    @staticmethod
+    def store_image(validated_data):
+        image = validated_data.pop('image', None)
+        if image is not None:
+            validated_data['image'] = image.save()
+            validated_data['image_width'] = image.width
+
+    @transaction.atomic
     def create(self, validated_data):
+        self.store_image(validated_data)
         ingredients = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
         author = self.context.get('request').user
@@ -151,9 +226,17 @@ class RecipePostSerializer(serializers.ModelSerializer):
         for ingredient in ingredients:
             RecipeIngredient.objects.create(recipe=recipe, **ingredient)
         recipe.tags.set(tags_data)
+        refresh_card(recipe.pk)
+        signature = minhash(features(recipe.name, [
+            ingredient['ingredient'].id for ingredient in ingredients
+        ]))
+        self.possible_duplicates = find_similar(signature)
+        store_signatures({recipe.pk: signature})
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        self.store_image(validated_data)
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags', None)
         if ingredients_data is not None:
@@ -164,12 +247,30 @@ class RecipePostSerializer(serializers.ModelSerializer):
                 )
         if tags_data is not None:
             instance.tags.set(tags_data)
-        return super().update(instance, validated_data)
+        instance = super().update(instance, validated_data)
+        refresh_card(instance.pk)
+        store_signatures({instance.pk: minhash(features(
+            instance.name,
+            instance.recipe_ingr.values_list('ingredient_id', flat=True)
+        ))})
+        return instance
 
     def to_representation(self, instance):
-        return RecipeSerializer(
+        data = RecipeSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
+        duplicates = getattr(self, 'possible_duplicates', None)
+        if duplicates:
+            # Рецепт сохраняется, клиент лишь получает предупреждение.
+            names = dict(Recipe.objects.filter(
+                pk__in=[pk for pk, _ in duplicates]
+            ).values_list('pk', 'name'))
+            data['possible_duplicates'] = [
+                {'id': pk, 'name': names.get(pk),
+                 'similarity': round(score, 2)}
+                for pk, score in duplicates
+            ]
+        return data
 
 
 class UserSubscriptionSerializer(CustUserSerializer):
@@ -197,6 +298,8 @@ class UserSubscriptionSerializer(CustUserSerializer):
         return InfoRecipeSerializer(recipes, many=True, read_only=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author__id=obj.id).count()
 
 
@@ -249,3 +352,12 @@ class FavoritesListSerializer(serializers.ModelSerializer):
             instance.recipe, context={
                 'request': self.context.get('request')}
         ).data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    status_url = serializers.HyperlinkedIdentityField(view_name='jobs-detail')
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'attempts', 'result', 'error',
+                  'created_at', 'updated_at', 'status_url']
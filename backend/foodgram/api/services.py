@@ -0,0 +1,22 @@
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient
+
+
+def shopping_list_text(user):
+    ingredients = RecipeIngredient.objects.filter(
+        recipe__shopping__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(amount=Sum('amount')).order_by('ingredient__name')
+
+    shop_list = []
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        amount = ingredient['amount']
+        measurement_unit = ingredient['ingredient__measurement_unit']
+        shop_list.append(f"{name} - {amount} {measurement_unit}")
+
+    ingredient_list = "Список покупок:\n"
+    ingredient_list += ",\n".join(shop_list)
+    return ingredient_list
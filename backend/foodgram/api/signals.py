@@ -0,0 +1,36 @@
+"""Инвалидация api_cache по тегам при изменении моделей."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.caching import api_cache
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.signals import AUTHOR_CARD_FIELDS
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    api_cache.invalidate(f'recipe:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, **kwargs):
+    api_cache.invalidate('tags')
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    api_cache.invalidate('ingredients')
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not (
+        AUTHOR_CARD_FIELDS & set(update_fields)
+    ):
+        return
+    # Автор входит в карточки его рецептов.
+    api_cache.invalidate(*(
+        f'recipe:{pk}' for pk in
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    ))
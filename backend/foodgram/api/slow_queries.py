@@ -0,0 +1,230 @@
+"""Журнал медленных SQL-запросов с привязкой к коду.
+
+SlowQueryRecorder подключается через connection.execute_wrapper и
+запоминает запросы дольше SLOW_QUERY_THRESHOLD_MS вместе с view,
+методом сериализатора и сокращённым стеком вызовов проекта. После ответа
+записи объединяются по отпечатку запроса в таблице SlowQuery; при первом
+появлении отпечатка туда же сохраняется EXPLAIN. С SLOW_QUERY_ASYNC
+запись и EXPLAIN выполняет фоновый поток процесса (slow_query_writer),
+а не поток запроса, который и так оказался медленным. Параметры
+запросов нужны только для EXPLAIN и остаются в памяти процесса: в
+базу и в очередь задач они не попадают. Записи, не сохранённые к
+аварийному завершению процесса, теряются.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import (DatabaseError, IntegrityError, connections,
+                       transaction)
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.models import SlowQuery
+
+logger = logging.getLogger('api.slow_queries')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+PROJECT_DIR = str(settings.BASE_DIR)
+STACK_DEPTH = 8
+SKIPPED_FILES = ('manage.py', 'middleware.py', 'slow_queries.py')
+
+
+def fingerprint(sql):
+    normalized = NUMBER.sub('?', IN_LIST.sub('IN (...)', sql))
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def describe_frame(frame):
+    code = frame.f_code
+    owner = frame.f_locals.get('self')
+    name = code.co_name
+    if owner is not None:
+        name = f'{type(owner).__name__}.{name}'
+    return name
+
+
+def attribute(frame):
+    """Определяет view, метод сериализатора и стек кода проекта.
+
+    Из сериализаторов предпочитается метод, объявленный в проекте
+    (например, UserSubscriptionSerializer.get_recipes), а не внутренний
+    метод DRF, в котором фактически выполнился запрос.
+    """
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.views import APIView
+
+    view = serializer = project_serializer = None
+    stack = []
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        in_project = (filename.startswith(PROJECT_DIR)
+                      and not filename.endswith(SKIPPED_FILES))
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, BaseSerializer):
+            serializer = serializer or describe_frame(frame)
+            if in_project and project_serializer is None:
+                project_serializer = describe_frame(frame)
+        if view is None and isinstance(owner, APIView):
+            action = getattr(owner, 'action', None)
+            view = f'{type(owner).__name__}.{action or frame.f_code.co_name}'
+        if in_project and len(stack) < STACK_DEPTH:
+            stack.append(
+                f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} '
+                f'{describe_frame(frame)}'
+            )
+        frame = frame.f_back
+    parts = (view, project_serializer or serializer)
+    origin = ' -> '.join(part for part in parts if part)
+    return origin or (stack[0] if stack else 'unknown'), stack
+
+
+class SlowQueryRecorder:
+    def __init__(self, alias, threshold):
+        self.alias = alias
+        self.threshold = threshold
+        self.records = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= self.threshold:
+                self.record(sql, params, many, duration)
+
+    def record(self, sql, params, many, duration):
+        key = fingerprint(sql)
+        record = self.records.get(key)
+        if record is None:
+            origin, stack = attribute(sys._getframe(2))
+            record = self.records[key] = {
+                'sql': sql, 'params': None if many else params,
+                'origin': origin, 'stack': stack,
+                'calls': 0, 'total': 0.0, 'max': 0.0,
+            }
+            logger.warning(
+                'Медленный запрос %.1f мс в %s: %s',
+                duration, origin, sql[:500]
+            )
+        record['calls'] += 1
+        record['total'] += duration
+        record['max'] = max(record['max'], duration)
+
+    def save(self):
+        if not self.records:
+            return
+        records, self.records = self.records, {}
+        if settings.SLOW_QUERY_ASYNC:
+            slow_query_writer.add(self.alias, records)
+        else:
+            save_records(self.alias, records)
+
+
+class SlowQueryWriter:
+    """Записи медленных запросов, которые сохраняет фоновый поток.
+
+    Записи одного отпечатка из разных запросов объединяются до записи.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, alias, records):
+        with self.lock:
+            for key, record in records.items():
+                merged = self.pending.setdefault((alias, key), record)
+                if merged is not record:
+                    merged['calls'] += record['calls']
+                    merged['total'] += record['total']
+                    merged['max'] = max(merged['max'], record['max'])
+            if self.thread is None:
+                self.start()
+        self.wakeup.set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.flush()
+            connections.close_all()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for (alias, key), record in pending.items():
+            try:
+                save_record(alias, key, record)
+            except DatabaseError:
+                logger.exception('Не удалось сохранить медленный запрос')
+        return len(pending)
+
+
+def save_records(alias, records):
+    for key, record in records.items():
+        save_record(alias, key, record)
+
+
+def save_record(alias, key, record):
+    changes = {
+        'calls': F('calls') + record['calls'],
+        'total_time': F('total_time') + record['total'],
+        'max_time': Greatest(F('max_time'), record['max']),
+        'last_seen': timezone.now(),
+    }
+    queryset = SlowQuery.objects.using(alias).filter(fingerprint=key)
+    if queryset.update(**changes):
+        return
+    try:
+        with transaction.atomic(using=alias):
+            SlowQuery.objects.using(alias).create(
+                fingerprint=key,
+                sql=record['sql'],
+                origin=record['origin'][:255],
+                stack='\n'.join(record['stack']),
+                explain=explain(alias, record),
+                calls=record['calls'],
+                total_time=record['total'],
+                max_time=record['max'],
+            )
+    except IntegrityError:
+        queryset.update(**changes)
+
+
+def explain(alias, record):
+    if not settings.SLOW_QUERY_EXPLAIN or record['params'] is None:
+        return ''
+    if not record['sql'].lstrip().upper().startswith('SELECT'):
+        return ''
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    try:
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {record["sql"]}', record['params'])
+                rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}'
+    return '\n'.join(
+        ' '.join(str(value) for value in row) for row in rows
+    )
+
+
+slow_query_writer = SlowQueryWriter()
+atexit.register(slow_query_writer.flush)
@@ -0,0 +1,68 @@
+from api.caching import api_cache
+from api.jobs import report_progress, task
+from api.protected import delete_protected, protected_url, save_protected
+from api.services import shopping_list_text
+from recipes.cards import refresh_cards as refresh_recipe_cards
+from recipes.deletion import bulk_delete
+from recipes.feeds import affected, publish_changes, schedule_publish
+from recipes.images import write_stored_variants
+from recipes.models import Recipe
+from users.models import User
+
+
+@task
+def build_shopping_list(user_id):
+    name = save_protected(
+        user_id, 'shopping_list.txt', shopping_list_text(user_id)
+    )
+    return {'file': protected_url(name)}
+
+
+@task
+def delete_protected_file(name):
+    delete_protected(name)
+    return {'file': name}
+
+
+@task
+def generate_image_variants(name):
+    write_stored_variants(name)
+    return {'image': name}
+
+
+@task
+def delete_users(user_ids):
+    changes = affected(Recipe.objects.filter(author_id__in=user_ids))
+    deleted = bulk_delete(
+        User.objects.filter(pk__in=user_ids),
+        progress=lambda deleted: report_progress(deleted=deleted)
+    )
+    # bulk_delete не отправляет сигналов.
+    api_cache.invalidate(*(f'recipe:{pk}' for pk in changes['recipe_ids']))
+    schedule_publish(**changes)
+    return deleted
+
+
+@task
+def delete_recipes(recipe_ids):
+    changes = affected(Recipe.objects.filter(pk__in=recipe_ids))
+    deleted = bulk_delete(
+        Recipe.objects.filter(pk__in=recipe_ids),
+        progress=lambda deleted: report_progress(deleted=deleted)
+    )
+    api_cache.invalidate(*(f'recipe:{pk}' for pk in recipe_ids))
+    schedule_publish(**changes)
+    return deleted
+
+
+@task
+def publish_feeds(**changes):
+    publish_changes(**changes)
+    return changes
+
+
+@task
+def refresh_cards(recipe_ids):
+    return {'cards': refresh_recipe_cards(
+        Recipe.objects.filter(pk__in=recipe_ids)
+    )}
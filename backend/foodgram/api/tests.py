@@ -0,0 +1,418 @@
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+
+from api.caching import api_cache
+from api.jobs import (TASKS, claim_job, enqueue, execute_job, prune_jobs,
+                      requeue_stale_jobs)
+from api.models import Job, SlowQuery
+from api.slow_queries import SlowQueryWriter, slow_query_writer
+from recipes.cards import refresh_card
+from recipes.models import (FavoritesList, Ingredient, Recipe, RecipeCard,
+                            RecipeIngredient, Tag)
+from users.models import User
+
+
+def create_user(username, **extra):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username,
+        first_name='Анна', last_name='Петрова', password='secret', **extra
+    )
+
+
+class APITestCase(TestCase):
+    """Рецепты в базе, чистый api_cache и выполнение задач очереди."""
+
+    def setUp(self):
+        caches[settings.API_CACHE_ALIAS].clear()
+        api_cache.clear_local()
+        self.author = create_user('author')
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='яйца', measurement_unit='шт'
+        )
+
+    def create_recipe(self, name, author=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=author or self.author, name=name, text=name,
+                cooking_time=10, image='recipes/images/recipe.jpg'
+            )
+            recipe.tags.add(self.tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=2
+            )
+            # Как сериализатор рецепта: карточка в той же транзакции.
+            refresh_card(recipe.pk)
+        return recipe
+
+    def run_jobs(self):
+        """Выполняет задачи очереди, как run_workers --burst."""
+        done = 0
+        while True:
+            with self.captureOnCommitCallbacks(execute=True):
+                job = claim_job('test')
+                if job is None:
+                    return done
+                execute_job(job)
+            done += 1
+
+    def login(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+
+
+@override_settings(API_CACHE_ENABLED=True, API_CACHE_ALLOW_LOCAL=True,
+                   CARDS_ASYNC=True, FEEDS_ENABLED=False)
+class CardRefreshTests(APITestCase):
+    def test_tag_rename_refreshes_cached_detail(self):
+        recipe = self.create_recipe('Омлет')
+        url = f'/api/recipes/{recipe.pk}/'
+        before = self.client.get(url)
+        self.assertEqual(before.json()['tags'][0]['name'], 'Завтрак')
+        self.tag.name = 'Утро'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+        # Карточку ещё не пересобрали: detail кэширует старую.
+        self.client.get(url)
+        self.assertEqual(self.run_jobs(), 1)
+        after = self.client.get(url)
+        self.assertEqual(after.json()['tags'][0]['name'], 'Утро')
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        listed = self.client.get('/api/recipes/').json()['results']
+        self.assertEqual(listed[0]['tags'][0]['name'], 'Утро')
+
+    def test_recipe_without_card_is_served_without_writes(self):
+        recipe = self.create_recipe('Омлет')
+        RecipeCard.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['id'], recipe.pk)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if not query['sql'].lstrip().upper().startswith('SELECT')
+        ])
+        call_command('rebuild_recipe_cards', missing=True, stdout=StringIO())
+        self.assertTrue(RecipeCard.objects.filter(recipe=recipe).exists())
+
+
+@override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+class MetricsAccessTests(TestCase):
+    url = '/api/metrics'
+
+    def get(self, **extra):
+        return self.client.get(self.url, REMOTE_ADDR='192.0.2.1', **extra)
+
+    def test_anonymous_request_is_rejected(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(
+            self.get(HTTP_X_FORWARDED_FOR='10.0.0.5').status_code, 401
+        )
+        self.assertEqual(
+            self.get(HTTP_AUTHORIZATION='Bearer wrong').status_code, 401
+        )
+
+    def test_token_allowed_ip_and_staff(self):
+        self.assertEqual(
+            self.get(HTTP_AUTHORIZATION='Bearer secret').status_code, 200
+        )
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+        admin = create_user('admin', is_staff=True)
+        token = Token.objects.create(user=admin)
+        self.assertEqual(
+            self.get(HTTP_AUTHORIZATION=f'Token {token.key}').status_code, 200
+        )
+
+
+@override_settings(API_CACHE_ENABLED=False, FEEDS_ENABLED=False)
+class SearchTests(APITestCase):
+    def test_prefix_matches_come_first(self):
+        self.create_recipe('Яичница с омлетом')
+        omelette = self.create_recipe('Омлет')
+        self.create_recipe('Борщ')
+        results = self.client.get(
+            '/api/recipes/', {'name': 'омл'}
+        ).json()['results']
+        self.assertEqual(results[0]['id'], omelette.pk)
+        self.assertNotIn('Борщ', [recipe['name'] for recipe in results])
+
+    def test_search_runs_after_user_filters(self):
+        reader = create_user('reader')
+        for number in range(40):
+            recipe = self.create_recipe(f'Омлет {number}')
+        FavoritesList.objects.create(user=reader, recipe=recipe)
+        self.login(reader)
+        for params in ({'is_favorited': 1},
+                       {'is_favorited': 1, 'name': 'омлет'}):
+            results = self.client.get('/api/recipes/', params).json()
+            self.assertEqual(
+                [item['id'] for item in results['results']], [recipe.pk]
+            )
+
+
+@override_settings(API_CACHE_ENABLED=False, FEEDS_ENABLED=False)
+class ConditionalGetTests(APITestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        self.old = self.create_recipe('Омлет')
+        self.new = self.create_recipe('Яичница')
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_after_delete_ignores_if_modified_since(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.old.delete()
+        since = http_date(time.time() + 60)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_changes_with_user_interactions(self):
+        reader = create_user('reader')
+        self.login(reader)
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(f'{self.url}{self.old.pk}/favorite/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][-1]['is_favorited'])
+
+    def test_detail_if_modified_since(self):
+        url = f'{self.url}{self.old.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(FEEDS_ENABLED=False)
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+        def flaky(name):
+            self.calls.append(name)
+            raise ValueError(name)
+
+        TASKS['flaky'] = flaky
+        self.addCleanup(TASKS.pop, 'flaky')
+
+    def test_failed_job_is_retried_then_dead(self):
+        job = enqueue('flaky', max_attempts=2, name='x')
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        self.assertEqual(self.calls, ['x', 'x'])
+        self.assertIn('ValueError', job.error)
+
+    def test_job_result_is_saved(self):
+        recipe = self.create_recipe('Омлет')
+        self.run_jobs()
+        job = enqueue('refresh_cards', recipe_ids=[recipe.pk])
+        self.assertEqual(self.run_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.DONE, {'cards': 1}))
+
+    def test_stale_jobs_are_requeued_within_max_attempts(self):
+        locked_at = timezone.now() - timedelta(
+            seconds=settings.JOB_LOCK_TIMEOUT + 1
+        )
+        retried, exhausted = [
+            Job.objects.create(
+                name='flaky', payload={'name': 'x'}, status=Job.RUNNING,
+                locked_at=locked_at, attempts=attempts, max_attempts=2
+            )
+            for attempts in (1, 2)
+        ]
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertEqual(requeue_stale_jobs(), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, Job.FAILED)
+        self.assertEqual(exhausted.status, Job.DEAD)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.run_jobs()
+        self.assertEqual(len(self.calls), 1)
+
+    @override_settings(JOB_RETENTION=60)
+    def test_prune_deletes_only_old_finished_jobs(self):
+        old = timezone.now() - timedelta(seconds=61)
+        jobs = {
+            (status, age): Job.objects.create(name='flaky', status=status)
+            for status in (Job.DONE, Job.DEAD, Job.QUEUED)
+            for age in ('old', 'new')
+        }
+        Job.objects.filter(
+            pk__in=[job.pk for (_, age), job in jobs.items() if age == 'old']
+        ).update(updated_at=old)
+        self.assertEqual(prune_jobs(), 2)
+        self.assertEqual(
+            set(Job.objects.values_list('pk', flat=True)),
+            {job.pk for (status, age), job in jobs.items()
+             if age == 'new' or status == Job.QUEUED},
+        )
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0.0001, SLOW_QUERY_ASYNC=True,
+                   API_CACHE_ENABLED=False, FEEDS_ENABLED=False)
+class SlowQueryTests(APITestCase):
+    def test_queries_are_saved_outside_the_request(self):
+        self.create_recipe('Омлет')
+        with mock.patch.object(SlowQueryWriter, 'start'):
+            response = self.client.get('/api/recipes/?name=омлет')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(SlowQuery.objects.exists())
+        # Параметры запросов не попадают в очередь задач.
+        self.assertFalse(Job.objects.exists())
+        self.assertGreater(slow_query_writer.flush(), 0)
+        self.assertTrue(SlowQuery.objects.filter(
+            origin__startswith='RecipeViewSet.list'
+        ).exclude(explain='').exists())
+
+
+@override_settings(API_CACHE_ENABLED=True, API_CACHE_ALLOW_LOCAL=True,
+                   CARDS_ASYNC=True, FEEDS_ENABLED=False)
+class ApiCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe('Омлет')
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_loader_runs_once_and_none_is_cached(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+
+        for _ in range(3):
+            self.assertIsNone(api_cache.get_or_set('missing', loader))
+        self.assertEqual(len(calls), 1)
+
+    def test_recipe_update_refreshes_detail(self):
+        self.assertEqual(self.client.get(self.url).json()['name'], 'Омлет')
+        self.login(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.url, {'name': 'Омлет с сыром'},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.get(self.url).json()['name'], 'Омлет с сыром'
+        )
+
+    def test_deleted_recipe_detail_is_not_found(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_author_rename_refreshes_detail(self):
+        self.client.get(self.url)
+        self.author.first_name = 'Мария'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        self.run_jobs()
+        author = self.client.get(self.url).json()['author']
+        self.assertEqual(author['first_name'], 'Мария')
+
+    def test_tag_and_ingredient_lists_are_invalidated(self):
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 1)
+        self.assertEqual(
+            len(self.client.get('/api/ingredients/?name=мол').json()), 0
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#49B64E', slug='dinner')
+            Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 2)
+        self.assertEqual(
+            len(self.client.get('/api/ingredients/?name=мол').json()), 1
+        )
+
+
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'throttle.sqlite3')
+        settings_override = override_settings(
+            THROTTLE_ENABLED=True, THROTTLE_SQLITE_PATH=path,
+            THROTTLE_BUCKETS={
+                'shopping_list': {'user': ('1/hour', 2)},
+                'ingredient_search': {'anon': ('1/hour', 1)},
+            },
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def shopping_list(self, user):
+        self.login(user)
+        return self.client.get('/api/recipes/download_shopping_cart/')
+
+    def test_user_bucket_allows_burst_then_throttles(self):
+        statuses = [self.shopping_list(self.author).status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.shopping_list(self.author)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(
+            self.shopping_list(create_user('reader')).status_code, 200
+        )
+
+    def test_anonymous_buckets_are_per_ip(self):
+        def search(ip):
+            return self.client.get(
+                '/api/ingredients/', REMOTE_ADDR=ip
+            ).status_code
+
+        self.assertEqual(
+            [search('192.0.2.1'), search('192.0.2.1'), search('192.0.2.2')],
+            [200, 429, 200],
+        )
+
+    @override_settings(THROTTLE_STORE='cache')
+    def test_cache_store(self):
+        statuses = [self.shopping_list(self.author).status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_store_failure_does_not_block_requests(self):
+        with mock.patch('api.throttling.SQLiteBucketStore.take',
+                        side_effect=sqlite3.OperationalError('locked')):
+            with self.assertLogs('api.throttling', 'ERROR'):
+                statuses = [self.shopping_list(self.author).status_code
+                            for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 200])
@@ -0,0 +1,170 @@
+"""Ограничение частоты дорогих запросов алгоритмом token bucket.
+
+Для каждой области (scope) задаются скорость пополнения и ёмкость
+корзины: клиент может сделать до ``burst`` запросов подряд, дальше — не
+чаще ``rate``. Корзины ведутся отдельно для каждого пользователя, для
+анонимных клиентов — по IP. Области назначаются действиям view через
+атрибут ``throttle_scopes``, настройки — в THROTTLE_BUCKETS.
+
+Состояние корзин общее для всех воркеров хоста: по умолчанию это
+SQLite-файл THROTTLE_SQLITE_PATH (лучше на tmpfs), либо, при
+THROTTLE_STORE = 'cache', кэш Django THROTTLE_CACHE. Через кэш списание
+не атомарно, и при гонке клиент может получить на запрос-другой больше.
+
+Если хранилище недоступно (файл заблокирован дольше таймаута, ошибка
+кэша), запрос пропускается без ограничения, а ошибка пишется в лог:
+сбой ограничителя не должен ронять сами запросы.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from api.metrics import THROTTLED_REQUESTS
+
+logger = logging.getLogger('api.throttling')
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600,
+           'd': 86400, 'day': 86400}
+BUCKET_TTL = 86400
+
+
+def parse_rate(rate):
+    """'10/min' -> жетонов в секунду."""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period]
+
+
+def refill(tokens, updated, now, rate, capacity):
+    """Списывает жетон; возвращает (остаток, ожидание в секундах)."""
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class SQLiteBucketStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=1, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, '
+                'tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, rate, capacity):
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = connection.execute(
+                'SELECT tokens, updated FROM bucket WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated = row or (capacity, now)
+            tokens, wait = refill(tokens, updated, now, rate, capacity)
+            connection.execute(
+                'INSERT OR REPLACE INTO bucket VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            if random.random() < 0.001:
+                connection.execute(
+                    'DELETE FROM bucket WHERE updated < ?',
+                    (now - BUCKET_TTL,)
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                try:
+                    connection.execute('ROLLBACK')
+                except sqlite3.Error:
+                    pass
+            # Соединение могло сломаться (файл удалён, диск полон):
+            # следующий вызов откроет новое.
+            connection.close()
+            self.local.connection = None
+            raise
+        return wait
+
+
+class CacheBucketStore:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, rate, capacity):
+        cache = caches[self.alias]
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens, wait = refill(tokens, updated, now, rate, capacity)
+        cache.set(key, (tokens, now), BUCKET_TTL)
+        return wait
+
+
+_stores = {}
+
+
+def get_store():
+    if settings.THROTTLE_STORE == 'cache':
+        key = ('cache', settings.THROTTLE_CACHE)
+        factory = CacheBucketStore
+    else:
+        key = ('sqlite', settings.THROTTLE_SQLITE_PATH)
+        factory = SQLiteBucketStore
+    if key not in _stores:
+        _stores[key] = factory(key[1])
+    return _stores[key]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ограничивает действия view, перечисленные в throttle_scopes."""
+
+    def allow_request(self, request, view):
+        self.delay = None
+        scopes = getattr(view, 'throttle_scopes', None)
+        if not scopes or not settings.THROTTLE_ENABLED:
+            return True
+        scope = scopes.get(getattr(view, 'action', None))
+        if scope is None:
+            return True
+        if request.user and request.user.is_authenticated:
+            kind, ident = 'user', request.user.pk
+        else:
+            kind, ident = 'anon', self.get_ident(request)
+        bucket = settings.THROTTLE_BUCKETS.get(scope, {}).get(kind)
+        if bucket is None:
+            return True
+        rate, capacity = bucket
+        try:
+            self.delay = get_store().take(
+                f'throttle:{scope}:{kind}:{ident}', parse_rate(rate),
+                capacity
+            )
+        except Exception:
+            logger.exception('Хранилище ограничения частоты недоступно, '
+                             'запрос %s пропущен', scope)
+            self.delay = None
+            return True
+        if self.delay:
+            THROTTLED_REQUESTS.labels(scope).inc()
+            return False
+        return True
+
+    def wait(self):
+        return self.delay
@@ -1,8 +1,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (CustUserViewSet, IngredientViewSet, RecipeViewSet,
-                       TagViewSet)
+from api.views import (CacheStatsView, CustUserViewSet, IngredientViewSet,
+                       JobViewSet, MetricsView, ProfileDownloadView,
+                       ProfileListView, ProtectedFileView, RecipeViewSet,
+                       TagViewSet, TimingsView)
 
 router = DefaultRouter()
 
@@ -10,8 +12,17 @@ router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'users', CustUserViewSet, basename='users')
+router.register(r'jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('cache/', CacheStatsView.as_view(), name='cache-stats'),
+    path('timings/', TimingsView.as_view(), name='timings'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:name>.<str:extension>',
+         ProfileDownloadView.as_view(), name='profile-download'),
+    path('files/<path:path>', ProtectedFileView.as_view(),
+         name='protected-file'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
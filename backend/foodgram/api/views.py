@@ -1,38 +1,74 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Count, Exists, OuterRef, Value
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from api.filters import IngredientFilter, RecipeFilter
-from api.permissions import IsAdminAuthorOrReadOnly
+from api.caching import api_cache
+from api.conditional import Validators
+from api.export import stream_export
+from api.filters import IngredientFilter, RecipeFilter, UserFilter
+from api.instrumentation import SerializationTimingMixin, route_stats
+from api.jobs import enqueue
+from api.metrics import render_metrics
+from api.profiling import list_profiles, profile_path
+from api.permissions import CanScrapeMetrics, IsAdminAuthorOrReadOnly
+from api.protected import is_owner, protected_response
+from api.models import Job
+from api.pagination import PageCustPagination
 from api.serializers import (CustUserSerializer, FavoritesListSerializer,
-                             IngredientSerializer, RecipePostSerializer,
-                             RecipeSerializer, ShoppingListSerializer,
-                             SubscriptionSerializer, TagSerializer,
-                             UserSubscriptionSerializer)
-from recipes.models import (FavoritesList, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingList, Tag)
+                             IngredientSerializer, JobSerializer,
+                             RecipePostSerializer, RecipeSerializer,
+                             ShoppingListSerializer, SubscriptionSerializer,
+                             TagSerializer, UserSubscriptionSerializer)
+from api.services import shopping_list_text
+from recipes.cards import render_card, unsaved_cards
+from recipes.models import (FavoritesList, Ingredient, Recipe, ShoppingList,
+                            Tag)
+from recipes.view_counter import view_counter
 from users.models import Subscription, User
 
 
-class CustUserViewSet(UserViewSet):
+class CustUserViewSet(SerializationTimingMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustUserSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = PageCustPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = UserFilter
+    throttle_scopes = {'export': 'data_export'}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+    def get_instance(self):
+        user = self.request.user
+        # Подписка на себя запрещена SubscriptionSerializer.
+        user.is_subscribed = False
+        return user
 
     @action(detail=False,
             methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        queryset = User.objects.filter(author__user=user)
-        print(f'kveriseeet={queryset}')
+        queryset = User.objects.filter(author__user=request.user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+            recipes_count=Count('recipe'),
+        ).order_by('id')
         paginator = self.pagination_class()
         result_page = paginator.paginate_queryset(queryset, request)
         serializer = UserSubscriptionSerializer(
@@ -40,6 +76,21 @@ class CustUserViewSet(UserViewSet):
         )
         return paginator.get_paginated_response(serializer.data)
 
+    @action(detail=False,
+            methods=['get'],
+            url_path='me/export',
+            permission_classes=[IsAuthenticated])
+    def export(self, request):
+        response = StreamingHttpResponse(
+            stream_export(request.user), content_type='application/zip'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="foodgram-{request.user.id}.zip"'
+        )
+        # nginx не должен буферизовать архив целиком.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     @action(detail=True,
             methods=['post'],
             permission_classes=[IsAuthenticated])
@@ -66,34 +117,139 @@ class CustUserViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def interaction_flags(user):
+    """Аннотации признаков избранного, корзины и подписки для рецептов."""
+    if not user.is_authenticated:
+        return {name: Value(False, output_field=BooleanField())
+                for name in ('is_favorited', 'is_in_shopping_cart',
+                             'is_subscribed')}
+    return {
+        'is_favorited': Exists(FavoritesList.objects.filter(
+            user=user, recipe_id=OuterRef('pk'))),
+        'is_in_shopping_cart': Exists(ShoppingList.objects.filter(
+            user=user, recipe_id=OuterRef('pk'))),
+        'is_subscribed': Exists(Subscription.objects.filter(
+            user=user, author_id=OuterRef('author_id'))),
+    }
+
+
+class TagViewSet(SerializationTimingMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return Response(api_cache.get_or_set('tags', lambda: list(
+            self.get_serializer(self.get_queryset(), many=True).data
+        ), tags=['tags']))
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(SerializationTimingMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
     pagination_class = None
+    throttle_scopes = {'list': 'ingredient_search'}
+
+    def list(self, request, *args, **kwargs):
+        name = ' '.join(request.query_params.get('name', '').lower().split())
+        return Response(api_cache.get_or_set(
+            f'ingredients:{name}',
+            lambda: list(self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data),
+            tags=['ingredients'],
+        ))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAdminAuthorOrReadOnly]
     pagination_class = PageNumberPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    throttle_scopes = {
+        'create': 'recipe_create',
+        'download_shopping_cart': 'shopping_list',
+    }
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeSerializer
         return RecipePostSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Список из готовых карточек: один запрос на страницу.
+
+        Фильтры и сортировка применяются к рецептам, карточка и признаки
+        пользователя добавляются в тот же запрос.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = Validators.for_queryset(request, queryset)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return validators.apply(not_modified)
+        flags = interaction_flags(request.user)
+        rows = self.paginate_queryset(
+            queryset.annotate(**flags).values(
+                'pk', 'views', 'card__data', *flags
+            )
+        )
+        missing = [row['pk'] for row in rows if row['card__data'] is None]
+        if missing:
+            cards = unsaved_cards(missing)
+            for row in rows:
+                row['card__data'] = row['card__data'] or cards[row['pk']]
+        return validators.apply(self.get_paginated_response([
+            render_card(
+                row['card__data'], request, views=row['views'],
+                **{name: row[name] for name in flags}
+            )
+            for row in rows
+        ]))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Карточка рецепта из api_cache и признаки пользователя.
+
+        Отсутствующий рецепт тоже кэшируется, число просмотров в кэше
+        обновляется вместе с записью.
+        """
+        pk = str(kwargs['pk'])
+        if not pk.isdigit():
+            raise Http404
+        recipe = api_cache.get_or_set(
+            f'recipe:{pk}', lambda: self.cached_recipe(pk),
+            tags=[f'recipe:{pk}', 'tags', 'ingredients'],
+        )
+        if recipe is None:
+            raise Http404
+        validators = Validators(request, recipe['updated_at'])
+        view_counter.increment(int(pk))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return validators.apply(not_modified)
+        flags = {}
+        if request.user.is_authenticated:
+            annotations = interaction_flags(request.user)
+            flags = Recipe.objects.filter(pk=pk).annotate(
+                **annotations).values(*annotations).first() or {}
+        return validators.apply(Response(render_card(
+            recipe['card__data'], request, views=recipe['views'], **flags
+        )))
+
+    @staticmethod
+    def cached_recipe(pk):
+        recipe = Recipe.objects.filter(pk=pk).values(
+            'updated_at', 'views', 'card__data'
+        ).first()
+        if recipe is not None and recipe['card__data'] is None:
+            recipe['card__data'] = unsaved_cards([pk])[int(pk)]
+        return recipe
+
     @action(detail=True,
             methods=['post'],
             permission_classes=[IsAuthenticated])
@@ -146,23 +302,97 @@ class RecipeViewSet(viewsets.ModelViewSet):
             methods=['get'],
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-
-        shop_list = []
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            amount = ingredient['amount']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            shop_list.append(f"{name} - {amount} {measurement_unit}")
-
-        ingredient_list = "Список покупок:\n"
-        ingredient_list += ",\n".join(shop_list)
-        response = HttpResponse(ingredient_list, content_type='text/plain')
+        if request.query_params.get('async') in ('1', 'true'):
+            job = enqueue('build_shopping_list', user=request.user,
+                          user_id=request.user.id)
+            serializer = JobSerializer(job, context={'request': request})
+            return Response(
+                serializer.data, status=status.HTTP_202_ACCEPTED,
+                headers={'Location': serializer.data['status_url']}
+            )
+        response = HttpResponse(
+            shopping_list_text(request.user), content_type='text/plain'
+        )
         response['Content-Disposition'] = (
             'attachment; filename="shopping_list.txt"'
         )
         return response
+
+
+class JobViewSet(SerializationTimingMixin, mixins.RetrieveModelMixin,
+                 viewsets.GenericViewSet):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+
+class CacheStatsView(APIView):
+    """Статистика api_cache текущего процесса."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(api_cache.stats())
+
+    def delete(self, request):
+        api_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TimingsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(route_stats.snapshot())
+
+    def delete(self, request):
+        route_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsView(APIView):
+    permission_classes = [CanScrapeMetrics]
+
+    def get(self, request):
+        content, content_type = render_metrics()
+        return HttpResponse(content, content_type=content_type)
+
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response([
+            {
+                'name': name,
+                'pstats': request.build_absolute_uri(f'{name}.prof'),
+                'folded': request.build_absolute_uri(f'{name}.folded'),
+            }
+            for name in list_profiles()
+        ])
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name, extension):
+        path = profile_path(name, f'.{extension}')
+        if path is None:
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True)
+
+
+class ProtectedFileView(APIView):
+    """Отдаёт файл владельцу через X-Accel-Redirect; чужим — 404."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path):
+        response = None
+        if is_owner(request.user, path):
+            response = protected_response(path)
+        if response is None:
+            raise Http404
+        return response
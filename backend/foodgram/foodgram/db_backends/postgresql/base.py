@@ -0,0 +1,124 @@
+"""PostgreSQL с проверкой соединений и необязательным пулом.
+
+Проверка (CONN_HEALTH_CHECKS, как в Django 4.1): постоянное соединение
+(CONN_MAX_AGE > 0) перед первым запросом в каждом HTTP-запросе
+проверяется через ``SELECT 1``; разорванное соединение переоткрывается,
+а не приводит к ошибке.
+
+Пул (POOL_SIZE > 0) предназначен для запуска под ASGI, где запросы
+обслуживаются разными потоками и постоянные соединения на поток быстро
+исчерпывают max_connections. Закрытие соединения возвращает его в общий
+пул процесса, поэтому CONN_MAX_AGE должен быть 0 (иначе соединения
+закреплены за потоками) — это проверяется при создании соединения. Когда
+все POOL_SIZE соединений заняты, поток ждёт освобождения до POOL_TIMEOUT
+секунд, затем получает ошибку «пул исчерпан».
+"""
+import threading
+
+import psycopg2.extras
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+DEFAULT_POOL_TIMEOUT = 10
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool, который ждёт свободного соединения.
+
+    Стандартный getconn() сразу бросает PoolError, когда заняты все
+    maxconn соединений.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout, **kwargs):
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolError(
+                f'Пул соединений исчерпан: все {self.maxconn} заняты дольше '
+                f'{self.timeout} с; увеличьте POOL_SIZE до числа потоков'
+            )
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE') or 0
+        if size <= 0:
+            return None
+        if self.settings_dict.get('CONN_MAX_AGE'):
+            raise ImproperlyConfigured(
+                'POOL_SIZE > 0 требует CONN_MAX_AGE = 0: соединения '
+                'возвращаются в пул при закрытии в конце запроса.'
+            )
+        with _pools_lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = BlockingConnectionPool(
+                    1, size, timeout=self.settings_dict.get(
+                        'POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT
+                    ), **self.get_connection_params()
+                )
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.getconn()
+        if connection.closed:
+            # Разорванное соединение заменяется новым в том же слоте.
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # putconn откатывает незавершённую транзакцию и закрывает
+        # соединение в неизвестном состоянии.
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
@@ -0,0 +1,130 @@
+import threading
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from psycopg2.pool import PoolError
+
+from foodgram.db_backends.postgresql import base
+
+SETTINGS = {
+    'ENGINE': 'foodgram.db_backends.postgresql',
+    'NAME': 'foodgram', 'USER': 'foodgram', 'PASSWORD': '', 'HOST': '',
+    'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None, 'AUTOCOMMIT': True,
+    'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+    'POOL_SIZE': 0,
+}
+
+
+def fake_connection(*args, **kwargs):
+    connection = mock.MagicMock(closed=0, isolation_level=1)
+    connection.get_transaction_status.return_value = 0
+    return connection
+
+
+def wrapper(alias, **settings_dict):
+    return base.DatabaseWrapper({**SETTINGS, **settings_dict}, alias)
+
+
+class HealthCheckTests(SimpleTestCase):
+    def setUp(self):
+        self.db = wrapper('health')
+        self.db.connection = mock.Mock()
+        self.db.autocommit = True
+        self.close = mock.patch.object(
+            self.db, 'close', side_effect=self.closed
+        ).start()
+        self.connect = mock.patch.object(self.db, 'connect').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def closed(self):
+        self.db.connection = None
+
+    def test_unusable_connection_is_replaced(self):
+        with mock.patch.object(self.db, 'is_usable', return_value=False):
+            self.db.ensure_connection()
+        self.close.assert_called_once()
+        self.connect.assert_called_once()
+
+    def test_usable_connection_is_kept(self):
+        with mock.patch.object(self.db, 'is_usable', return_value=True):
+            self.db.ensure_connection()
+        self.close.assert_not_called()
+        self.connect.assert_not_called()
+
+    def test_checked_once_per_request(self):
+        with mock.patch.object(
+            self.db, 'is_usable', return_value=True
+        ) as is_usable:
+            self.db.ensure_connection()
+            self.db.ensure_connection()
+            self.assertEqual(is_usable.call_count, 1)
+            self.db.close_if_unusable_or_obsolete()
+            self.db.ensure_connection()
+            self.assertEqual(is_usable.call_count, 2)
+
+    def test_not_checked_inside_atomic_block(self):
+        self.db.in_atomic_block = True
+        with mock.patch.object(self.db, 'is_usable') as is_usable:
+            self.db.ensure_connection()
+        is_usable.assert_not_called()
+
+    def test_disabled(self):
+        self.db.settings_dict['CONN_HEALTH_CHECKS'] = False
+        with mock.patch.object(self.db, 'is_usable') as is_usable:
+            self.db.ensure_connection()
+        is_usable.assert_not_called()
+
+
+@mock.patch('psycopg2.pool.psycopg2.connect', side_effect=fake_connection)
+class PoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('psycopg2.extras.register_default_jsonb')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        base._pools.clear()
+
+    def test_connection_returns_to_pool(self, connect):
+        db = wrapper('pool', POOL_SIZE=2)
+        first = db.get_new_connection({})
+        db.connection = first
+        db._close()
+        self.assertIs(db.get_new_connection({}), first)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_closed_connection_is_replaced(self, connect):
+        db = wrapper('pool', POOL_SIZE=1)
+        broken = db.get_new_connection({})
+        db.connection = broken
+        db._close()
+        broken.closed = 1
+        connection = db.get_new_connection({})
+        self.assertIsNot(connection, broken)
+        self.assertFalse(connection.closed)
+
+    def test_exhausted_pool_waits_for_timeout(self, connect):
+        db = wrapper('pool', POOL_SIZE=1, POOL_TIMEOUT=0.01)
+        db.get_new_connection({})
+        with self.assertRaisesMessage(PoolError, 'POOL_SIZE'):
+            db.get_new_connection({})
+
+    def test_waiting_checkout_gets_returned_connection(self, connect):
+        pool = base.BlockingConnectionPool(1, 1, timeout=5)
+        first = pool.getconn()
+        checked_out = []
+        waiter = threading.Thread(
+            target=lambda: checked_out.append(pool.getconn())
+        )
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        pool.putconn(first)
+        waiter.join(5)
+        self.assertEqual(checked_out, [first])
+
+    def test_pool_requires_conn_max_age_zero(self, connect):
+        db = wrapper('pool', POOL_SIZE=2, CONN_MAX_AGE=60)
+        with self.assertRaises(ImproperlyConfigured):
+            db.get_new_connection({})
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestTimingMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -93,16 +98,39 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 #     }
 # }
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked with
+# SELECT 1 before reuse in each request (CONN_HEALTH_CHECKS). Under ASGI set
+# DB_POOL_SIZE > 0 (DB_CONN_MAX_AGE must then be 0) to share a per-process pool instead
+# of a connection per thread; size it to the thread count, a checkout waits
+# up to DB_POOL_TIMEOUT seconds. Behind PgBouncer in transaction mode set
+# DB_DISABLE_SERVER_SIDE_CURSORS=True for the .iterator() based commands.
+# See foodgram/db_backends/postgresql/base.py.
+
+DB_ENGINE = os.getenv('DB_ENGINE', default='foodgram.db_backends.postgresql')
+if DB_ENGINE == 'django.db.backends.postgresql':
+    DB_ENGINE = 'foodgram.db_backends.postgresql'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default='0'))
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Pooled connections are returned at the end of each request.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default='0' if DB_POOL_SIZE else '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', default='True') == 'True',
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default='10')),
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', default='False') == 'True',
     }
 }
+if DB_ENGINE == 'foodgram.db_backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', default='5')),
+    }
 
 
 # Password validation
@@ -139,7 +167,7 @@ USE_TZ = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.MeteredTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -147,10 +175,31 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageCustPagination',
     'PAGE_SIZE': 6,
 }
 
+# Token bucket throttling (api.throttling): per scope, (rate, burst) for
+# authenticated users and for anonymous clients by IP. Bucket state is
+# shared by all workers of the host through a SQLite file or a cache.
+
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', default='True') == 'True'
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', default='sqlite')
+THROTTLE_SQLITE_PATH = os.getenv('THROTTLE_SQLITE_PATH', default='/dev/shm/foodgram-throttle.sqlite3' if os.path.isdir('/dev/shm') else os.path.join(BASE_DIR, 'throttle.sqlite3'))
+THROTTLE_CACHE = os.getenv('THROTTLE_CACHE', default='default')
+THROTTLE_BUCKETS = {
+    'shopping_list': {'user': ('20/hour', 5)},
+    'recipe_create': {'user': ('30/hour', 10)},
+    'data_export': {'user': ('3/hour', 2)},
+    'ingredient_search': {
+        'user': ('120/min', 60),
+        'anon': ('60/min', 30),
+    },
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -174,6 +223,133 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Per-user files (exports) outside MEDIA_ROOT, see api.protected. With
+# PROTECTED_MEDIA_ACCEL Django only authorizes the download and nginx
+# serves the file from the internal PROTECTED_MEDIA_URL location. Files
+# are deleted by a background job PROTECTED_FILE_TTL seconds after saving.
+
+PROTECTED_MEDIA_URL = '/protected/'
+PROTECTED_MEDIA_ROOT = os.getenv('PROTECTED_MEDIA_ROOT', default=os.path.join(BASE_DIR, 'protected'))
+PROTECTED_MEDIA_ACCEL = os.getenv('PROTECTED_MEDIA_ACCEL', default='False') == 'True'
+PROTECTED_FILE_TTL = int(os.getenv('PROTECTED_FILE_TTL', default=str(24 * 60 * 60)))
+
+# Recipe image pipeline (recipes.images).
+
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_MAX_DIMENSION = 2048
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', default='False') == 'True'
+
+# Recipe cards (recipes.cards): with CARDS_ASYNC cards affected by tag,
+# ingredient and profile changes are rebuilt by run_workers in chunks of
+# CARD_BATCH_SIZE recipes instead of inside the request.
+
+CARDS_ASYNC = os.getenv('CARDS_ASYNC', default='True') == 'True'
+
+# Buffered recipe view counter (recipes.view_counter): each worker writes
+# accumulated views in one UPDATE after this many views or seconds.
+
+VIEW_COUNTER_FLUSH_SIZE = int(os.getenv('VIEW_COUNTER_FLUSH_SIZE', default='100'))
+VIEW_COUNTER_FLUSH_INTERVAL = float(os.getenv('VIEW_COUNTER_FLUSH_INTERVAL', default='10'))
+
+# Caches. The default local-memory cache is per process; point
+# CACHE_BACKEND/CACHE_LOCATION at a shared backend (memcached, see
+# infra/docker-compose.yml) so that gunicorn workers and run_workers share
+# L2 entries, tag versions and load locks.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# Two-tier cache for API reads (api.caching): a per-process LRU of
+# API_CACHE_L1_SIZE entries in front of the API_CACHE_ALIAS cache. Stats
+# are at /api/cache/. Invalidation needs a shared L2: with a per-process
+# cache api_cache is off unless API_CACHE_ALLOW_LOCAL (single process).
+
+API_CACHE_ENABLED = os.getenv('API_CACHE_ENABLED', default='True') == 'True'
+API_CACHE_ALIAS = os.getenv('API_CACHE_ALIAS', default='default')
+API_CACHE_ALLOW_LOCAL = os.getenv('API_CACHE_ALLOW_LOCAL', default='False') == 'True'
+API_CACHE_L1_SIZE = int(os.getenv('API_CACHE_L1_SIZE', default='1000'))
+API_CACHE_L1_TIMEOUT = 5
+API_CACHE_TIMEOUT = 300
+API_CACHE_NEGATIVE_TIMEOUT = 30
+API_CACHE_EARLY_REFRESH_BETA = 1.0
+API_CACHE_LOCK_TIMEOUT = 10
+API_CACHE_WAIT_TIMEOUT = 2
+
+# Public Atom/RSS feeds and sitemap (recipes.feeds), written as static
+# files to FEEDS_ROOT and served by nginx. SITE_URL is the public origin
+# used for absolute links. With FEEDS_ASYNC (default) changes are published
+# by run_workers; set it to False when no worker runs.
+
+SITE_URL = os.getenv('SITE_URL', default='http://localhost')
+FEEDS_ENABLED = os.getenv('FEEDS_ENABLED', default='True') == 'True'
+FEEDS_ASYNC = os.getenv('FEEDS_ASYNC', default='True') == 'True'
+FEEDS_ROOT = os.getenv('FEEDS_ROOT', default=os.path.join(BASE_DIR, 'public'))
+FEED_SIZE = 50
+SITEMAP_SHARD_SIZE = 10000
+
+# Background jobs (api.jobs), executed by `manage.py run_workers`. Done and
+# dead jobs are deleted by the workers JOB_RETENTION seconds after they finish.
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_LOCK_TIMEOUT = 15 * 60
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', default=str(24 * 60 * 60)))
+
+# Request instrumentation: Server-Timing headers, timing log lines and
+# per-route aggregates at /api/timings/.
+
+REQUEST_TIMING_ENABLED = os.getenv('REQUEST_TIMING_ENABLED', default='False') == 'True'
+REQUEST_TIMING_WINDOW = int(os.getenv('REQUEST_TIMING_WINDOW', default='500'))
+
+# Prometheus metrics at /api/metrics. With several gunicorn workers set
+# PROMETHEUS_MULTIPROC_DIR so that values are aggregated across processes.
+# The endpoint is open to staff, to scrapers sending METRICS_TOKEN as a
+# bearer token and to the comma-separated METRICS_ALLOWED_IPS.
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='False') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(',') if ip.strip()]
+
+# On-demand profiling: staff requests with an X-Profile header or
+# ?profile=1, plus one in PROFILING_SAMPLE_RATE requests (0 disables sampling).
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', default='False') == 'True'
+PROFILING_SAMPLE_RATE = int(os.getenv('PROFILING_SAMPLE_RATE', default='0'))
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_DIR = os.getenv('PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', default='50'))
+
+# Slow query log: statements slower than the threshold are grouped by
+# fingerprint in api.SlowQuery. See `manage.py slow_queries`. With
+# SLOW_QUERY_ASYNC (default) the upsert and EXPLAIN run in a background
+# thread of the process instead of the request that was already slow.
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', default='0'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', default='True') == 'True'
+SLOW_QUERY_ASYNC = os.getenv('SLOW_QUERY_ASYNC', default='True') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
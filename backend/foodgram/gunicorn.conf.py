@@ -0,0 +1,24 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    """Очищает файлы метрик, оставшиеся от предыдущего запуска."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    """Сохраняет накопленные воркером просмотры и медленные запросы."""
+    from api.slow_queries import slow_query_writer
+    from recipes.view_counter import view_counter
+    view_counter.flush()
+    slow_query_writer.flush()
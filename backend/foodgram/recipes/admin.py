@@ -1,5 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Count
 
+from api.jobs import enqueue
+from users.admin_filters import AuthorFilter
+from .cards import refresh_card
+from .duplicates import refresh_signatures
 from .models import (FavoritesList, Ingredient, Recipe, RecipeIngredient,
                      ShoppingList, Tag)
 
@@ -8,7 +13,8 @@ from .models import (FavoritesList, Ingredient, Recipe, RecipeIngredient,
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ['pk', 'name', 'measurement_unit']
     search_fields = ['name']
-    list_filter = ['name']
+    list_filter = ['measurement_unit']
+    show_full_result_count = False
     empty_value_display = '-----'
 
 
@@ -22,25 +28,56 @@ class TagAdmin(admin.ModelAdmin):
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ['ingredient']
+    extra = 1
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ['pk', 'name', 'author', 'favorites']
-    search_fields = ['name', 'author']
-    list_filter = ['name', 'author', 'tags']
+    search_fields = ['name', 'author__username', 'author__email']
+    list_filter = [AuthorFilter, 'tags']
+    list_select_related = ['author']
+    autocomplete_fields = ['author']
+    show_full_result_count = False
     empty_value_display = '-----'
     inlines = [
         RecipeIngredientInline,
     ]
+    actions = ['delete_in_background']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorites_count=Count('favorites')
+        )
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        refresh_card(form.instance.pk)
+        refresh_signatures(Recipe.objects.filter(pk=form.instance.pk))
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorites(self, obj):
-        return FavoritesList.objects.filter(recipe=obj).count()
+        return obj.favorites_count
+
+    @admin.action(description='Удалить в фоне', permissions=['delete'])
+    def delete_in_background(self, request, queryset):
+        job = enqueue(
+            'delete_recipes', user=request.user,
+            recipe_ids=list(queryset.values_list('pk', flat=True))
+        )
+        self.message_user(
+            request, f'Удаление поставлено в очередь, задача #{job.pk}.',
+            messages.SUCCESS
+        )
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ['pk', 'recipe', 'ingredient', 'amount']
+    list_select_related = ['recipe', 'ingredient']
+    autocomplete_fields = ['recipe', 'ingredient']
+    show_full_result_count = False
     empty_value_display = '-----'
 
 
@@ -48,6 +85,9 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'recipe']
     search_fields = ['user__username', 'user__email']
+    list_select_related = ['user', 'recipe']
+    autocomplete_fields = ['user', 'recipe']
+    show_full_result_count = False
     empty_value_display = '-----'
 
 
@@ -55,4 +95,7 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'recipe']
     search_fields = ['user__username', 'user__email']
+    list_select_related = ['user', 'recipe']
+    autocomplete_fields = ['user', 'recipe']
+    show_full_result_count = False
     empty_value_display = '-----'
@@ -0,0 +1,158 @@
+"""Карточки рецептов — денормализованное представление для списков.
+
+Карточка хранит в RecipeCard.data то, что RecipeSerializer собирает из
+пяти таблиц: поля рецепта, автора, теги и ингредиенты. Список рецептов
+читает карточки одним запросом, а при выдаче в них подставляются только
+данные, зависящие от запроса: признаки избранного, корзины и подписки,
+число просмотров и абсолютные URL изображений.
+
+Карточки пересобираются в транзакции изменения рецепта (сериализатор,
+админка). Изменение тега, ингредиента или профиля автора затрагивает
+много рецептов, поэтому сигналы ставят пересборку в очередь порциями
+(``schedule_refresh``, при CARDS_ASYNC — задачи refresh_cards). Чтение
+карточки не пишет в базу: рецепт без карточки собирается в памяти
+(``unsaved_cards``), а недостающие карточки создаёт
+``rebuild_recipe_cards --missing``.
+Пересборка сдвигает updated_at рецептов и сбрасывает их записи в
+api_cache, а ленты и шарды sitemap публикуются заново.
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from api.caching import api_cache
+from recipes.feeds import schedule_publish
+from recipes.images import image_variants
+from recipes.models import Recipe, RecipeCard, RecipeIngredient
+
+CARD_BATCH_SIZE = 500
+
+
+def card_queryset():
+    return Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch('recipe_ingr', queryset=RecipeIngredient.objects
+                 .select_related('ingredient').order_by('pk')),
+    )
+
+
+def build_card(recipe):
+    author = recipe.author
+    image = recipe.image.name
+    return {
+        'id': recipe.id,
+        'tags': [
+            {'id': tag.id, 'name': tag.name, 'color': tag.color,
+             'slug': tag.slug}
+            for tag in recipe.tags.all()
+        ],
+        'author': {
+            'email': author.email,
+            'id': author.id,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+        },
+        'ingredients': [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingr.all()
+        ],
+        'name': recipe.name,
+        'image': default_storage.url(image) if image else None,
+        'image_srcset': [
+            [default_storage.url(name), width]
+            for width, name in image_variants(
+                image, recipe.image_width).items()
+        ],
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def refresh_cards(recipes):
+    """Пересобирает карточки рецептов queryset порциями.
+
+    Возвращает количество карточек.
+    """
+    last_pk, total = 0, 0
+    while True:
+        ids = list(recipes.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:CARD_BATCH_SIZE])
+        if not ids:
+            return total
+        with transaction.atomic():
+            # Представление рецепта изменилось: сдвигаем его watermark
+            # для условных GET-запросов.
+            Recipe.objects.filter(pk__in=ids).update(
+                updated_at=timezone.now()
+            )
+            RecipeCard.objects.filter(recipe_id__in=ids).delete()
+            RecipeCard.objects.bulk_create([
+                RecipeCard(recipe=recipe, data=build_card(recipe))
+                for recipe in card_queryset().filter(pk__in=ids)
+            ])
+            schedule_publish(recipe_ids=ids)
+            api_cache.invalidate(*(f'recipe:{pk}' for pk in ids))
+        last_pk = ids[-1]
+        total += len(ids)
+
+
+def refresh_card(recipe_id):
+    return refresh_cards(Recipe.objects.filter(pk=recipe_id))
+
+
+def schedule_refresh(recipe_ids):
+    """Пересобирает карточки после фиксации текущей транзакции."""
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return
+
+    def refresh():
+        if not settings.CARDS_ASYNC:
+            refresh_cards(Recipe.objects.filter(pk__in=recipe_ids))
+            return
+        from api.jobs import enqueue
+        for start in range(0, len(recipe_ids), CARD_BATCH_SIZE):
+            enqueue('refresh_cards',
+                    recipe_ids=recipe_ids[start:start + CARD_BATCH_SIZE])
+
+    transaction.on_commit(refresh)
+
+
+def unsaved_cards(recipe_ids):
+    """{id рецепта: карточка}, собранные без записи в RecipeCard."""
+    return {
+        recipe.pk: build_card(recipe)
+        for recipe in card_queryset().filter(pk__in=recipe_ids)
+    }
+
+
+def render_card(data, request, is_favorited=False,
+                is_in_shopping_cart=False, is_subscribed=False, views=0):
+    """Карточка в формате RecipeSerializer."""
+    def absolute(url):
+        return request.build_absolute_uri(url) if url else url
+
+    return {
+        'id': data['id'],
+        'tags': data['tags'],
+        'author': {**data['author'], 'is_subscribed': is_subscribed},
+        'ingredients': data['ingredients'],
+        'is_favorited': is_favorited,
+        'is_in_shopping_cart': is_in_shopping_cart,
+        'name': data['name'],
+        'image': absolute(data['image']),
+        'image_srcset': ', '.join(
+            f'{absolute(url)} {width}w' for url, width in data['image_srcset']
+        ),
+        'text': data['text'],
+        'cooking_time': data['cooking_time'],
+        'views_count': views,
+    }
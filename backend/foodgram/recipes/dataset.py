@@ -0,0 +1,137 @@
+"""Описание формата выгрузки данных в NDJSON.
+
+Каждая строка файла — объект ``{"model": ..., "pk": ..., "fields": {...}}``.
+Модели выгружаются в порядке ``DATASET``, поэтому при загрузке связанные
+объекты всегда встречаются раньше ссылающихся на них.
+"""
+import datetime
+import gzip
+import sys
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.models import (FavoritesList, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingList, Tag)
+from users.models import Subscription, User
+
+
+@dataclass
+class DatasetModel:
+    label: str
+    model: type
+    fields: list
+    relations: dict = field(default_factory=dict)
+    natural_key: list = field(default_factory=list)
+
+    @property
+    def unique_keys(self):
+        """Наборы выгружаемых полей, уникальные в базе; естественный
+        ключ первым."""
+        opts = self.model._meta
+        candidates = [tuple(self.natural_key)] if self.natural_key else []
+        candidates += [
+            (model_field.name,) for model_field in opts.concrete_fields
+            if model_field.unique and not model_field.primary_key
+        ]
+        candidates += [tuple(fields) for fields in opts.unique_together]
+        candidates += [
+            tuple(constraint.fields)
+            for constraint in opts.total_unique_constraints
+        ]
+        keys = []
+        for key in candidates:
+            if key not in keys and set(key) <= set(self.fields):
+                keys.append(key)
+        return keys
+
+
+DATASET = [
+    DatasetModel(
+        'users.user', User,
+        ['email', 'username', 'first_name', 'last_name', 'password',
+         'is_active', 'is_staff', 'is_superuser', 'date_joined',
+         'last_login'],
+        natural_key=['email'],
+    ),
+    DatasetModel(
+        'recipes.tag', Tag, ['name', 'color', 'slug'],
+        natural_key=['slug'],
+    ),
+    DatasetModel(
+        'recipes.ingredient', Ingredient, ['name', 'measurement_unit'],
+        natural_key=['name', 'measurement_unit'],
+    ),
+    DatasetModel(
+        'users.subscription', Subscription, ['user', 'author'],
+        relations={'user': 'users.user', 'author': 'users.user'},
+    ),
+    DatasetModel(
+        'recipes.recipe', Recipe,
+        ['author', 'name', 'image', 'text', 'cooking_time', 'pub_date'],
+        relations={'author': 'users.user'},
+    ),
+    DatasetModel(
+        'recipes.recipe_tags', Recipe.tags.through, ['recipe', 'tag'],
+        relations={'recipe': 'recipes.recipe', 'tag': 'recipes.tag'},
+    ),
+    DatasetModel(
+        'recipes.recipeingredient', RecipeIngredient,
+        ['recipe', 'ingredient', 'amount'],
+        relations={
+            'recipe': 'recipes.recipe',
+            'ingredient': 'recipes.ingredient',
+        },
+    ),
+    DatasetModel(
+        'recipes.favoriteslist', FavoritesList, ['user', 'recipe'],
+        relations={'user': 'users.user', 'recipe': 'recipes.recipe'},
+    ),
+    DatasetModel(
+        'recipes.shoppinglist', ShoppingList, ['user', 'recipe'],
+        relations={'user': 'users.user', 'recipe': 'recipes.recipe'},
+    ),
+]
+
+DATASET_BY_LABEL = {item.label: item for item in DATASET}
+
+
+class DatasetEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder, сохраняющий микросекунды дат: загруженные
+    даты совпадают с выгруженными."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def open_dataset(path, mode):
+    """Открывает файл выгрузки; ``-`` — stdin/stdout, ``.gz`` — gzip."""
+    if path == '-':
+        return nullcontext(sys.stdout if 'w' in mode else sys.stdin)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+@contextmanager
+def keep_auto_now(model, names):
+    """Отключает auto_now/auto_now_add у выгруженных полей names, чтобы
+    сохранить их даты; остальные получают текущее время."""
+    fields = [
+        model_field for model_field in model._meta.concrete_fields
+        if model_field.name in names and (
+            getattr(model_field, 'auto_now', False)
+            or getattr(model_field, 'auto_now_add', False)
+        )
+    ]
+    saved = [(item.auto_now, item.auto_now_add) for item in fields]
+    for item in fields:
+        item.auto_now = item.auto_now_add = False
+    try:
+        yield
+    finally:
+        for item, (auto_now, auto_now_add) in zip(fields, saved):
+            item.auto_now, item.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,158 @@
+"""Поиск почти одинаковых рецептов по MinHash.
+
+Рецепт описывается множеством признаков: id ингредиентов и триграммы
+нормализованного названия. MinHash-подпись из SIGNATURE_SIZE минимумов
+хеш-функций сохраняется в RecipeSignature; доля совпавших позиций двух
+подписей оценивает коэффициент Жаккара их множеств.
+
+Для поиска кандидатов подпись режется на BANDS полос по ROWS значений;
+хеш каждой полосы хранится в RecipeBucket с индексом (band, bucket).
+Кандидаты — рецепты, совпавшие хотя бы в одной полосе, поэтому поиск
+не перебирает все рецепты. При 16 полосах по 4 строки пара с
+Жаккаром 0.8 становится кандидатом с вероятностью ~0.9998, с 0.3 —
+~0.12; кандидаты затем проверяются по полной подписи. Из одной полосы
+берётся не больше MAX_BAND_CANDIDATES рецептов: корзина популярной
+полосы (например, рецептов из одних и тех же ингредиентов) иначе
+приносит тысячи кандидатов.
+"""
+import hashlib
+import random
+import re
+import struct
+
+from django.db import connection, transaction
+
+from recipes.models import RecipeBucket, RecipeSignature
+
+BANDS = 16
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+DUPLICATE_THRESHOLD = 0.8
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SIGNATURE_FORMAT = f'<{SIGNATURE_SIZE}I'
+MAX_BAND_CANDIDATES = 100
+
+# Параметры хеш-функций фиксированы: подписи сравнимы между запусками.
+_random = random.Random(20230417)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+
+
+def normalize_name(name):
+    return ' '.join(re.findall(r'\w+', name.lower().replace('ё', 'е')))
+
+
+def features(name, ingredient_ids):
+    tokens = {f'i:{pk}' for pk in ingredient_ids}
+    name = normalize_name(name)
+    tokens.update(f'n:{name[i:i + 3]}' for i in range(len(name) - 2))
+    return tokens
+
+
+def token_hash(token):
+    return int.from_bytes(
+        hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little'
+    )
+
+
+def minhash(tokens):
+    hashes = [token_hash(token) for token in tokens] or [0]
+    return [
+        min((a * value + b) % MERSENNE_PRIME for value in hashes) & MAX_HASH
+        for a, b in PERMUTATIONS
+    ]
+
+
+def band_keys(signature):
+    """Хеши полос подписи как знаковые 64-битные числа."""
+    for band in range(BANDS):
+        chunk = struct.pack(
+            f'<{ROWS}I', *signature[band * ROWS:(band + 1) * ROWS]
+        )
+        digest = hashlib.blake2b(chunk, digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'little', signed=True)
+
+
+def similarity(first, second):
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_SIZE
+
+
+def pack(signature):
+    return struct.pack(SIGNATURE_FORMAT, *signature)
+
+
+def unpack(data):
+    return list(struct.unpack(SIGNATURE_FORMAT, bytes(data)))
+
+
+def recipe_signature(recipe):
+    return minhash(features(recipe.name, [
+        item.ingredient_id for item in recipe.recipe_ingr.all()
+    ]))
+
+
+def store_signatures(signatures):
+    """Сохраняет подписи и корзины: {id рецепта: подпись}."""
+    ids = list(signatures)
+    RecipeSignature.objects.filter(recipe_id__in=ids).delete()
+    RecipeBucket.objects.filter(recipe_id__in=ids).delete()
+    RecipeSignature.objects.bulk_create([
+        RecipeSignature(recipe_id=recipe_id, signature=pack(signature))
+        for recipe_id, signature in signatures.items()
+    ])
+    RecipeBucket.objects.bulk_create([
+        RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+        for recipe_id, signature in signatures.items()
+        for band, bucket in band_keys(signature)
+    ])
+
+
+def refresh_signatures(recipes, batch_size=1000):
+    """Пересчитывает подписи рецептов queryset; возвращает их число."""
+    recipes = recipes.prefetch_related('recipe_ingr').order_by('pk')
+    last_pk, total = 0, 0
+    while True:
+        batch = list(recipes.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic():
+            store_signatures({
+                recipe.pk: recipe_signature(recipe) for recipe in batch
+            })
+        last_pk = batch[-1].pk
+        total += len(batch)
+
+
+def band_candidates(signature, exclude=None):
+    """id рецептов из корзин подписи, не больше MAX_BAND_CANDIDATES на
+    полосу."""
+    queries = []
+    for band, bucket in band_keys(signature):
+        query = RecipeBucket.objects.filter(band=band, bucket=bucket)
+        if exclude is not None:
+            query = query.exclude(recipe_id=exclude)
+        queries.append(
+            query.values_list('recipe_id', flat=True)[:MAX_BAND_CANDIDATES]
+        )
+    if connection.features.supports_slicing_ordering_in_compound:
+        # Один запрос: UNION ограниченных выборок полос.
+        return set(queries[0].union(*queries[1:]))
+    return {recipe_id for query in queries for recipe_id in query}
+
+
+def find_similar(signature, exclude=None, threshold=DUPLICATE_THRESHOLD,
+                 limit=5):
+    """Рецепты, похожие на подпись: список (recipe_id, сходство)."""
+    candidate_ids = band_candidates(signature, exclude)
+    matches = []
+    for recipe_id, data in RecipeSignature.objects.filter(
+        recipe_id__in=candidate_ids
+    ).values_list('recipe_id', 'signature'):
+        score = similarity(signature, unpack(data))
+        if score >= threshold:
+            matches.append((recipe_id, score))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:limit]
@@ -0,0 +1,356 @@
+"""Ленты Atom/RSS и sitemap.xml в виде статических файлов.
+
+Файлы пишутся в FEEDS_ROOT и отдаются nginx напрямую, без Django:
+
+- feeds/recipes.atom, feeds/recipes.rss — новые рецепты;
+- feeds/tags/<slug>.{atom,rss} и feeds/authors/<id>.{atom,rss};
+- sitemap.xml — индекс шардов sitemaps/<раздел>-<n>.xml (рецепты и
+  страницы авторов), где шард n содержит объекты с id от
+  n * SITEMAP_SHARD_SIZE. Шард зависит только от id, поэтому новый
+  рецепт меняет последний шард, а изменённый — шард со своим id.
+
+Сигналы и refresh_cards после фиксации транзакции перегенерируют только
+затронутые файлы (``schedule_publish``), при FEEDS_ASYNC — фоновой
+задачей. Индекс при этом не пересчитывается по всей таблице: в
+опубликованном sitemap.xml заменяются строки изменённых шардов.
+Команда ``publish_feeds`` строит всё заново и удаляет лишние файлы.
+Каждый файл записывается во временный и переименовывается, поэтому nginx
+не отдаёт недописанный файл; неизменившийся файл не перезаписывается.
+"""
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+FEED_FORMATS = {'atom': Atom1Feed, 'rss': Rss201rev2Feed}
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+SHARD_PATH = re.compile(r'/sitemaps/(\w+)-(\d+)\.xml$')
+
+_pending = threading.local()
+
+
+def absolute(path):
+    return settings.SITE_URL.rstrip('/') + path
+
+
+def write_file(relative, content):
+    """Атомарно записывает файл; возвращает False, если он не изменился."""
+    path = os.path.join(settings.FEEDS_ROOT, relative)
+    content = content.encode()
+    try:
+        with open(path, 'rb') as file:
+            if file.read() == content:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp'
+    )
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(content)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+    return True
+
+
+def remove_file(relative):
+    try:
+        os.remove(os.path.join(settings.FEEDS_ROOT, relative))
+    except FileNotFoundError:
+        pass
+
+
+def feed_recipes(recipes):
+    return recipes.select_related('author').prefetch_related(
+        'tags'
+    ).order_by('-pub_date')[:settings.FEED_SIZE]
+
+
+def author_name(user):
+    return user.get_full_name() or user.username
+
+
+def write_feed(name, title, link, recipes):
+    """Пишет ленту в обоих форматах; пустая лента удаляется."""
+    recipes = list(feed_recipes(recipes))
+    for extension, feed_class in FEED_FORMATS.items():
+        relative = f'feeds/{name}.{extension}'
+        if not recipes:
+            remove_file(relative)
+            continue
+        feed = feed_class(
+            title=title,
+            link=absolute(link),
+            description=title,
+            language='ru',
+            feed_url=absolute(f'/{relative}'),
+        )
+        for recipe in recipes:
+            url = absolute(f'/recipes/{recipe.id}')
+            feed.add_item(
+                title=recipe.name,
+                link=url,
+                unique_id=url,
+                description=recipe.text,
+                author_name=author_name(recipe.author),
+                pubdate=recipe.pub_date,
+                updateddate=recipe.updated_at,
+                categories=[tag.name for tag in recipe.tags.all()],
+            )
+        write_file(relative, feed.writeString('utf-8'))
+
+
+def publish_recipes_feed():
+    write_feed('recipes', 'Foodgram — новые рецепты', '/recipes',
+               Recipe.objects.all())
+
+
+def publish_tag_feeds():
+    """Ленты всех тегов; ленты удалённых и переименованных удаляются."""
+    slugs = set()
+    for tag in Tag.objects.all():
+        slugs.add(tag.slug)
+        write_feed(f'tags/{tag.slug}', f'Foodgram — {tag.name}',
+                   '/recipes', Recipe.objects.filter(tags=tag))
+    remove_orphans('feeds/tags', slugs)
+
+
+def publish_tag_feed(tag_id):
+    tag = Tag.objects.filter(pk=tag_id).first()
+    if tag is not None:
+        write_feed(f'tags/{tag.slug}', f'Foodgram — {tag.name}',
+                   '/recipes', Recipe.objects.filter(tags=tag))
+
+
+def publish_author_feed(author_id):
+    author = User.objects.filter(pk=author_id).first()
+    if author is None:
+        # Автор удалён: write_feed удалит пустую ленту.
+        recipes, title = Recipe.objects.none(), ''
+    else:
+        recipes = Recipe.objects.filter(author=author)
+        title = f'Foodgram — рецепты {author_name(author)}'
+    write_feed(f'authors/{author_id}', title, f'/user/{author_id}', recipes)
+
+
+def remove_orphans(directory, names):
+    """Удаляет файлы каталога, имена которых (без расширения) не в names."""
+    try:
+        files = os.listdir(os.path.join(settings.FEEDS_ROOT, directory))
+    except FileNotFoundError:
+        return
+    for file in files:
+        if os.path.splitext(file)[0] not in names:
+            remove_file(os.path.join(directory, file))
+
+
+# Раздел sitemap: поле рецепта, по которому группируются страницы, и
+# адрес страницы. lastmod страницы — последнее изменение её рецептов.
+SITEMAP_SECTIONS = {
+    'recipes': ('pk', '/recipes/{}'),
+    'authors': ('author_id', '/user/{}'),
+}
+
+
+def shard_of(pk):
+    return pk // settings.SITEMAP_SHARD_SIZE
+
+
+def publish_shard(section, shard):
+    """Пишет шард; возвращает его lastmod или None для пустого шарда."""
+    field, path = SITEMAP_SECTIONS[section]
+    size = settings.SITEMAP_SHARD_SIZE
+    rows = Recipe.objects.filter(**{
+        f'{field}__gte': shard * size, f'{field}__lt': (shard + 1) * size,
+    }).values_list(field).annotate(lastmod=Max('updated_at')).order_by(field)
+    relative = f'sitemaps/{section}-{shard}.xml'
+    urls = [
+        '<url><loc>{}</loc><lastmod>{}</lastmod></url>'.format(
+            escape(absolute(path.format(pk))), lastmod.date().isoformat()
+        )
+        for pk, lastmod in rows
+    ]
+    if not urls:
+        remove_file(relative)
+        return None
+    write_file(relative, '\n'.join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<urlset xmlns="{SITEMAP_NAMESPACE}">',
+        *urls,
+        '</urlset>',
+        '',
+    ]))
+    return max(lastmod for _, lastmod in rows)
+
+
+def sitemap_shards():
+    """{(раздел, номер шарда): последнее изменение}, запрос на раздел."""
+    shards = {}
+    for section, (field, _) in SITEMAP_SECTIONS.items():
+        rows = Recipe.objects.annotate(
+            shard=F(field) / settings.SITEMAP_SHARD_SIZE
+        ).values_list('shard').annotate(lastmod=Max('updated_at'))
+        for shard, lastmod in rows.order_by('shard'):
+            shards[section, shard] = lastmod
+    return shards
+
+
+def read_sitemap_index():
+    """Шарды опубликованного sitemap.xml; None, если его нет."""
+    try:
+        root = ElementTree.parse(
+            os.path.join(settings.FEEDS_ROOT, 'sitemap.xml')
+        ).getroot()
+    except (FileNotFoundError, ElementTree.ParseError):
+        return None
+    shards = {}
+    for sitemap in root:
+        match = SHARD_PATH.search(
+            sitemap.findtext(f'{{{SITEMAP_NAMESPACE}}}loc', '')
+        )
+        lastmod = sitemap.findtext(f'{{{SITEMAP_NAMESPACE}}}lastmod')
+        if match is None or not lastmod:
+            return None
+        shards[match[1], int(match[2])] = datetime.fromisoformat(lastmod)
+    return shards
+
+
+def publish_sitemap_index(shards=None):
+    if shards is None:
+        shards = sitemap_shards()
+    write_file('sitemap.xml', '\n'.join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<sitemapindex xmlns="{SITEMAP_NAMESPACE}">',
+        *(
+            '<sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>'.format(
+                escape(absolute(f'/sitemaps/{section}-{shard}.xml')),
+                lastmod.isoformat(timespec='seconds'),
+            )
+            for (section, shard), lastmod in sorted(shards.items())
+        ),
+        '</sitemapindex>',
+        '',
+    ]))
+
+
+def publish_all():
+    """Полная генерация; файлы удалённых тегов, авторов и шардов стираются."""
+    publish_recipes_feed()
+    publish_tag_feeds()
+    author_ids = set(
+        Recipe.objects.values_list('author_id', flat=True).distinct()
+    )
+    for author_id in author_ids:
+        publish_author_feed(author_id)
+    remove_orphans('feeds/authors', {str(pk) for pk in author_ids})
+    shards = sitemap_shards()
+    for section, shard in shards:
+        publish_shard(section, shard)
+    remove_orphans('sitemaps', {
+        f'{section}-{shard}' for section, shard in shards
+    })
+    publish_sitemap_index(shards)
+    return len(author_ids), len(shards)
+
+
+def publish_changes(recipe_ids=(), tag_ids=(), author_ids=(),
+                    all_tags=False):
+    """Перегенерирует файлы, затронутые изменениями.
+
+    Теги и авторы существующих рецептов определяются здесь, для удалённых
+    рецептов их передают явно (см. affected).
+    """
+    tag_ids, author_ids = set(tag_ids), set(author_ids)
+    if recipe_ids:
+        tag_ids.update(Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('tag_id', flat=True))
+        author_ids.update(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('author_id', flat=True))
+        publish_recipes_feed()
+    if all_tags:
+        publish_tag_feeds()
+    else:
+        for tag_id in tag_ids:
+            publish_tag_feed(tag_id)
+    for author_id in author_ids:
+        publish_author_feed(author_id)
+    shards = {('recipes', shard_of(pk)) for pk in recipe_ids}
+    shards.update(('authors', shard_of(pk)) for pk in author_ids)
+    if not shards:
+        return
+    index = read_sitemap_index()
+    for section, shard in shards:
+        lastmod = publish_shard(section, shard)
+        if index is None:
+            continue
+        if lastmod is None:
+            index.pop((section, shard), None)
+        else:
+            index[section, shard] = lastmod
+    # Без опубликованного индекса он строится по всей таблице.
+    publish_sitemap_index(index)
+
+
+def affected(recipes):
+    """Изменения для publish_changes перед удалением рецептов."""
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    return {
+        'recipe_ids': recipe_ids,
+        'tag_ids': list(Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('tag_id', flat=True).distinct()),
+        'author_ids': list(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('author_id', flat=True).distinct()),
+    }
+
+
+def schedule_publish(recipe_ids=(), tag_ids=(), author_ids=(),
+                     all_tags=False):
+    """Публикует изменения после фиксации текущей транзакции.
+
+    Изменения одной транзакции (например, каскадное удаление рецептов
+    автора) объединяются и публикуются один раз. Изменения откатившейся
+    транзакции уходят вместе со следующими: публикация читает состояние
+    базы, поэтому лишняя перегенерация безвредна.
+    """
+    if not settings.FEEDS_ENABLED:
+        return
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        changes = _pending.changes = {
+            'recipe_ids': set(), 'tag_ids': set(), 'author_ids': set(),
+            'all_tags': False,
+        }
+    changes['recipe_ids'].update(recipe_ids)
+    changes['tag_ids'].update(tag_ids)
+    changes['author_ids'].update(author_ids)
+    changes['all_tags'] = changes['all_tags'] or all_tags
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        return
+    _pending.changes = None
+    changes = {
+        name: sorted(value) if isinstance(value, set) else value
+        for name, value in changes.items()
+    }
+    if settings.FEEDS_ASYNC:
+        from api.jobs import enqueue
+        enqueue('publish_feeds', **changes)
+    else:
+        publish_changes(**changes)
@@ -0,0 +1,214 @@
+"""Обработка загружаемых изображений рецептов.
+
+Изображение сохраняется под именем, производным от SHA-256 исходных
+байтов, поэтому одинаковые загрузки используют один файл и повторно не
+обрабатываются. Рядом с оригиналом сохраняются уменьшенные WebP-копии
+шириной из IMAGE_VARIANT_WIDTHS для srcset; копии не шире оригинала.
+
+Загрузка проверяется и кодируется при валидации (PreparedImage), а
+файлы пишутся только при сохранении рецепта: PreparedImage.save() в
+транзакции, discard() — если сохранение не удалось.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from recipes.models import Recipe
+
+IMAGE_DIR = 'recipes/images'
+DECODE_CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s+')
+HASHED_NAME = re.compile(
+    rf'^{IMAGE_DIR}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})\.\w+$'
+)
+
+
+class ImageError(ValueError):
+    pass
+
+
+def decode_base64(data, max_size):
+    """Декодирует base64 порциями, прерываясь при превышении max_size.
+
+    Переводы строк и пробелы (base64 с переносами) пропускаются.
+    """
+    data = WHITESPACE.sub('', data)
+    if len(data) * 3 // 4 > max_size + 3:
+        raise ImageError('Изображение слишком большое.')
+    output = io.BytesIO()
+    try:
+        for start in range(0, len(data), DECODE_CHUNK_SIZE):
+            output.write(base64.b64decode(
+                data[start:start + DECODE_CHUNK_SIZE], validate=True
+            ))
+            if output.tell() > max_size:
+                raise ImageError('Изображение слишком большое.')
+    except binascii.Error:
+        raise ImageError('Некорректные данные base64.')
+    return output.getvalue()
+
+
+def image_name(digest, extension):
+    return f'{IMAGE_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def variant_name(name, width):
+    return f'{os.path.splitext(name)[0]}-{width}.webp'
+
+
+def existing_image(digest):
+    for extension in ('jpg', 'png'):
+        name = image_name(digest, extension)
+        if default_storage.exists(name):
+            return name
+    return None
+
+
+def open_image(content):
+    try:
+        image = Image.open(io.BytesIO(content))
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageError('Слишком большое разрешение изображения.')
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ImageError('Загрузите корректное изображение.')
+    return ImageOps.exif_transpose(image)
+
+
+def encode(image, image_format, **options):
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+class PreparedImage:
+    """Проверенное изображение, ещё не записанное в хранилище."""
+
+    def __init__(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        self.created = []
+        self.image = None
+        self.name = existing_image(digest)
+        if self.name is not None:
+            self.width = stored_width(self.name)
+            return
+        image = open_image(content)
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        limit = settings.IMAGE_MAX_DIMENSION
+        image.thumbnail((limit, limit))
+        if has_alpha:
+            self.name = image_name(digest, 'png')
+            self.data = encode(image, 'PNG', optimize=True)
+        else:
+            self.name = image_name(digest, 'jpg')
+            self.data = encode(image, 'JPEG', quality=85, optimize=True,
+                               progressive=True)
+        self.image = image
+        self.width = image.width
+
+    def save(self):
+        """Записывает оригинал и варианты, возвращает имя оригинала.
+
+        При IMAGE_VARIANTS_ASYNC варианты создаёт фоновая задача
+        generate_image_variants, а не процесс запроса.
+        """
+        if self.image is None:
+            return self.name
+        if settings.IMAGE_VARIANTS_ASYNC:
+            from api.jobs import enqueue
+            self.save_file(self.name, self.data)
+            enqueue('generate_image_variants', name=self.name)
+            return self.name
+        for name, data in encode_variants(self.image, self.name):
+            self.save_file(name, data)
+        # Оригинал сохраняется после вариантов: его наличие означает, что
+        # все варианты уже записаны.
+        self.save_file(self.name, self.data)
+        return self.name
+
+    def save_file(self, name, data):
+        if save_once(name, data):
+            self.created.append(name)
+
+    def discard(self):
+        """Удаляет файлы, записанные save(), если на них не ссылаются."""
+        if self.created and not Recipe.objects.filter(
+            image=self.name
+        ).exists():
+            for name in self.created:
+                default_storage.delete(name)
+        self.created = []
+
+
+def stored_width(name):
+    with default_storage.open(name) as file:
+        return Image.open(file).width
+
+
+def encode_variants(image, name):
+    for width, variant in image_variants(name, image.width).items():
+        copy = image.copy()
+        copy.thumbnail((width, width * 4))
+        yield variant, encode(copy, 'WEBP', quality=80, method=4)
+
+
+def write_stored_variants(name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    for variant, data in encode_variants(image, name):
+        save_once(variant, data)
+
+
+def save_once(name, data):
+    """Сохраняет файл под точным именем; дубликат от гонки удаляется.
+
+    Возвращает True, если файл записан этим вызовом.
+    """
+    saved = default_storage.save(name, ContentFile(data))
+    if saved != name:
+        default_storage.delete(saved)
+        return False
+    return True
+
+
+def image_variants(name, width=None):
+    """WebP-варианты {ширина для srcset: имя}; для старых файлов — пусто.
+
+    Варианты не шире оригинала ширины width: первый вариант не уже
+    оригинала совпадает с ним по ширине и заканчивает список. Без width
+    возвращаются все возможные варианты (например, для удаления).
+    """
+    if not name or not HASHED_NAME.match(name):
+        return {}
+    variants = {}
+    for variant_width in sorted(settings.IMAGE_VARIANT_WIDTHS):
+        if width is not None and variant_width >= width:
+            variants[width] = variant_name(name, variant_width)
+            break
+        variants[variant_width] = variant_name(name, variant_width)
+    return variants
+
+
+def delete_unused_images(names):
+    """Стирает изображения и их варианты, на которые не ссылаются рецепты.
+
+    Возвращает количество стёртых изображений.
+    """
+    names = set(names) - set(
+        Recipe.objects.filter(image__in=names)
+        .values_list('image', flat=True)
+    )
+    for name in names:
+        for file in [name, *image_variants(name).values()]:
+            default_storage.delete(file)
+    return len(names)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.dataset import (DATASET, DATASET_BY_LABEL, DatasetEncoder,
+                             open_dataset)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка пользователей и рецептов в файл NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', type=str, default='-',
+            help='Файл выгрузки (.ndjson или .ndjson.gz), по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Размер порции, читаемой из курсора базы данных'
+        )
+        parser.add_argument(
+            '--models', nargs='+', choices=DATASET_BY_LABEL,
+            help='Выгрузить только перечисленные модели'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля')
+        labels = set(options['models'] or DATASET_BY_LABEL)
+        encoder = DatasetEncoder(ensure_ascii=False)
+        counts = {}
+        with open_dataset(options['path'], 'w') as output:
+            for item in DATASET:
+                if item.label not in labels:
+                    continue
+                counts[item.label] = self.export_model(
+                    item, output, encoder, options['chunk_size']
+                )
+        for label, count in counts.items():
+            self.stderr.write(f'{label}: {count}')
+
+    @staticmethod
+    def export_model(item, output, encoder, chunk_size):
+        rows = item.model.objects.order_by('pk').values_list(
+            'pk', *item.fields
+        ).iterator(chunk_size=chunk_size)
+        count = 0
+        for pk, *values in rows:
+            output.write(encoder.encode({
+                'model': item.label,
+                'pk': pk,
+                'fields': dict(zip(item.fields, values)),
+            }))
+            output.write('\n')
+            count += 1
+        return count
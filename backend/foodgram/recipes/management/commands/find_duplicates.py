@@ -0,0 +1,197 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import (DUPLICATE_THRESHOLD, refresh_signatures,
+                                similarity, unpack)
+from recipes.models import Recipe, RecipeBucket, RecipeSignature
+
+# Подписи загружаются для порции корзин, в которой не меньше стольких
+# рецептов, и освобождаются после её сравнения.
+SIGNATURE_BATCH_SIZE = 5000
+
+
+def bucket_groups():
+    """Рецепты, попавшие в одну корзину LSH, одним проходом по индексу."""
+    rows = RecipeBucket.objects.order_by('band', 'bucket').values_list(
+        'band', 'bucket', 'recipe_id'
+    ).iterator(chunk_size=10000)
+    key, group = None, []
+    for band, bucket, recipe_id in rows:
+        if (band, bucket) != key:
+            if len(group) > 1:
+                yield group
+            key, group = (band, bucket), []
+        group.append(recipe_id)
+    if len(group) > 1:
+        yield group
+
+
+def group_batches(groups):
+    """Корзины порциями примерно по SIGNATURE_BATCH_SIZE рецептов."""
+    batch, size = [], 0
+    for group in groups:
+        batch.append(group)
+        size += len(group)
+        if size >= SIGNATURE_BATCH_SIZE:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        # Сжатие пути без рекурсии: длинные цепочки не упираются в
+        # лимит глубины стека.
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        rank_first = self.rank.get(first, 0)
+        rank_second = self.rank.get(second, 0)
+        if rank_first < rank_second:
+            first, second = second, first
+        self.parent[second] = first
+        if rank_first == rank_second:
+            self.rank[first] = rank_first + 1
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+class BucketComparer:
+    """Сравнивает рецепты корзин и объединяет похожие в группы.
+
+    Корзина не крупнее max_bucket сравнивается попарно. В крупной корзине
+    каждый рецепт сравнивается только с ведущими — рецептами, не похожими
+    на предыдущих ведущих; их не больше max_bucket. Так крупная корзина
+    стоит O(n * max_bucket) сравнений, а не O(n²), и не пропускается.
+    Рецепты, для которых ведущих уже не хватило, остаются без сравнения.
+    """
+
+    def __init__(self, threshold, max_bucket):
+        self.threshold = threshold
+        self.max_bucket = max_bucket
+        self.duplicates = DisjointSet()
+        self.comparisons = 0
+        self.split_buckets = 0
+        self.unchecked = 0
+
+    def similar(self, first, second, signatures):
+        self.comparisons += 1
+        return similarity(
+            signatures[first], signatures[second]
+        ) >= self.threshold
+
+    def compare_batch(self, groups):
+        ids = {recipe_id for group in groups for recipe_id in group}
+        signatures = {
+            recipe_id: unpack(data)
+            for recipe_id, data in RecipeSignature.objects.filter(
+                recipe_id__in=ids
+            ).values_list('recipe_id', 'signature')
+        }
+        for group in groups:
+            group = [pk for pk in sorted(group) if pk in signatures]
+            if len(group) <= self.max_bucket:
+                self.compare_pairs(group, signatures)
+            else:
+                self.split_buckets += 1
+                self.compare_leaders(group, signatures)
+
+    def compare_pairs(self, group, signatures):
+        find = self.duplicates.find
+        for position, first in enumerate(group):
+            for second in group[position + 1:]:
+                # Пара уже в одной группе по другой полосе.
+                if find(first) == find(second):
+                    continue
+                if self.similar(first, second, signatures):
+                    self.duplicates.union(first, second)
+
+    def compare_leaders(self, group, signatures):
+        leaders = []
+        for recipe_id in group:
+            for leader in leaders:
+                if (self.duplicates.find(recipe_id)
+                        == self.duplicates.find(leader)
+                        or self.similar(recipe_id, leader, signatures)):
+                    self.duplicates.union(recipe_id, leader)
+                    break
+            else:
+                if len(leaders) < self.max_bucket:
+                    leaders.append(recipe_id)
+                else:
+                    self.unchecked += 1
+
+
+class Command(BaseCommand):
+    help = ('Ищет почти одинаковые рецепты по MinHash-подписям '
+            'ингредиентов и названий.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=DUPLICATE_THRESHOLD,
+            help='Минимальное оценочное сходство (коэффициент Жаккара)'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать подписи всех рецептов, а не только новых'
+        )
+        parser.add_argument(
+            '--max-bucket', type=int, default=200,
+            help='Корзины LSH крупнее этого размера сравниваются с '
+                 'ведущими рецептами, а не попарно'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько групп дублей вывести'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes = Recipe.objects.all()
+        if not options['rebuild']:
+            recipes = recipes.filter(signature__isnull=True)
+        computed = refresh_signatures(recipes)
+        self.stdout.write(f'Подписей рассчитано: {computed}')
+
+        comparer = BucketComparer(options['threshold'], options['max_bucket'])
+        for groups in group_batches(bucket_groups()):
+            comparer.compare_batch(groups)
+        self.stdout.write(
+            f'Сравнений: {comparer.comparisons}, крупных корзин: '
+            f'{comparer.split_buckets}, без сравнения: {comparer.unchecked}'
+        )
+
+        groups = sorted(comparer.duplicates.groups(), key=len, reverse=True)
+        names = dict(Recipe.objects.filter(
+            pk__in=[pk for group in groups[:options['limit']]
+                    for pk in group]
+        ).values_list('pk', 'name'))
+        for group in groups[:options['limit']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Группа из {len(group)} рецептов:'
+            ))
+            for pk in sorted(group):
+                self.stdout.write(f'  {pk}: {names.get(pk)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Групп дублей: {len(groups)}, рецептов в них: '
+            f'{sum(map(len, groups))}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -1,39 +1,143 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from recipes.models import Ingredient
 
+DEFAULT_BATCH_SIZE = 1000
+JSON_READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=','):
+        if len(row) < 2:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    """Потоково читает JSON-массив объектов или NDJSON."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip('[,]').lstrip()
+        if not buffer:
+            if eof:
+                return
+            chunk = file.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_READ_SIZE)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов в базу из файла csv.'
+    help = 'Загрузка ингредиентов в базу из файла csv или json.'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--path', type=str, help='Путь к CSV-файлу с ингредиентами'
+            '--path', type=str,
+            help='Путь к CSV- или JSON-файлу с ингредиентами'
+        )
+        parser.add_argument(
+            '--format', choices=READERS, default=None,
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одной транзакции'
         )
 
     def handle(self, *args, **options):
         file_path = options['path']
         if not file_path:
-            raise ValueError(
-                'Укажите путь к CSV-файлу с ингредиентами '
+            raise CommandError(
+                'Укажите путь к файлу с ингредиентами '
                 'через аргумент --path'
             )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        file_format = (
+            options['format']
+            or os.path.splitext(file_path)[1].lstrip('.').lower()
+        )
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}')
 
-        with open(file_path, 'r', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            ingredients = []
-            for row in csv_reader:
-                try:
-                    ingredient = Ingredient(
-                        name=row[0],
-                        measurement_unit=row[1],
+        started = time.monotonic()
+        inserted = skipped = 0
+        with open(file_path, 'r', encoding='utf-8') as file:
+            rows = READERS[file_format](file)
+            for number, batch in enumerate(
+                batches(rows, options['batch_size']), 1
+            ):
+                batch_inserted = self.import_batch(batch)
+                inserted += batch_inserted
+                skipped += len(batch) - batch_inserted
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'Пакет {number}: добавлено {inserted}, '
+                        f'пропущено {skipped}'
                     )
-                    ingredients.append(ingredient)
-                except ValueError:
-                    print('Ошибка при импорте ингредиента:', row)
-            Ingredient.objects.bulk_create(ingredients)
-            self.stdout.write(self.style.SUCCESS(
-                'Ингредиенты успешно импортированы.')
+
+        elapsed = time.monotonic() - started
+        total = inserted + skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты импортированы: добавлено {inserted}, '
+            f'обновлено 0, пропущено {skipped} '
+            f'({total / elapsed if elapsed else total:.0f} строк/с).'
+        ))
+
+    @staticmethod
+    def import_batch(batch):
+        """Добавляет новые ингредиенты пакета, возвращает их количество.
+
+        Все поля ингредиента входят в ключ уникальности, поэтому
+        обновлять при конфликте нечего: существующие строки пропускаются.
+        """
+        rows = {
+            (name.strip(), unit.strip()) for name, unit in batch
+            if name.strip()
+        }
+        with transaction.atomic():
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in rows}
+                ).values_list('name', 'measurement_unit')
             )
+            new = [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in rows - existing
+            ]
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        return len(new)
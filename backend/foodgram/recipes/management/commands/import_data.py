@@ -0,0 +1,234 @@
+import json
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.caching import api_cache
+from recipes.cards import refresh_cards
+from recipes.dataset import DATASET_BY_LABEL, keep_auto_now, open_dataset
+from recipes.duplicates import refresh_signatures
+from recipes.models import Recipe
+from recipes.tag_map import invalidate_tag_map
+from users.models import User
+
+DEFAULT_BATCH_SIZE = 1000
+REFERENCED = {
+    target for item in DATASET_BY_LABEL.values()
+    for target in item.relations.values()
+}
+# Связи пользователя, меняющие его watermark для условных GET-запросов.
+INTERACTIONS = {
+    'recipes.favoriteslist', 'recipes.shoppinglist', 'users.subscription',
+}
+
+
+def allocate_ids(model, count):
+    """Резервирует count первичных ключей для новых объектов.
+
+    В PostgreSQL ключи берутся из последовательности таблицы, как при
+    обычной вставке, поэтому параллельные вставки их не получат. В
+    других базах — после текущего максимума, внутри транзакции пакета.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [model._meta.db_table, model._meta.pk.column, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    current = model.objects.aggregate(Max('pk'))['pk__max'] or 0
+    return list(range(current + 1, current + count + 1))
+
+
+class Importer:
+    """Загружает записи NDJSON пакетами, переназначая первичные ключи.
+
+    Новым объектам ключи выдаются через allocate_ids, а соответствие
+    старых ключей новым хранится только в виде словарей целых чисел.
+    Записи, совпадающие с объектами в базе или с предыдущими записями
+    файла по естественному ключу (email, slug, название и единица
+    измерения) или другому уникальному полю (например, тег с новым slug,
+    но занятым названием), не вставляются: ссылки на них переназначаются
+    на найденный объект. Такие записи считаются пропущенными.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.id_maps = defaultdict(dict)
+        self.new_ids = defaultdict(list)
+        self.created = defaultdict(int)
+        self.skipped = defaultdict(int)
+        self.users = set()
+
+    def run(self, lines):
+        label, batch = None, []
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['model'] not in DATASET_BY_LABEL:
+                raise CommandError(f'Неизвестная модель: {record["model"]}')
+            if batch and (
+                record['model'] != label or len(batch) >= self.batch_size
+            ):
+                self.flush(label, batch)
+                batch = []
+            label = record['model']
+            batch.append(record)
+        if batch:
+            self.flush(label, batch)
+        self.reset_sequences()
+
+    def flush(self, label, records):
+        item = DATASET_BY_LABEL[label]
+        records = [
+            record for record in records if self.remap_relations(item, record)
+        ]
+        with transaction.atomic():
+            records, aliases = self.drop_existing(item, records)
+            ids = self.allocate(item, records)
+            objects = [
+                item.model(pk=pk, **self.field_values(item, record))
+                for pk, record in zip(ids, records)
+            ]
+            with keep_auto_now(item.model, item.fields):
+                # Совпадения с базой уже отброшены; ignore_conflicts
+                # страхует связующие таблицы от параллельной вставки.
+                item.model.objects.bulk_create(
+                    objects, ignore_conflicts=item.label not in REFERENCED
+                )
+        id_map = self.id_maps[label]
+        # Оригинал мог сам оказаться повтором по следующему ключу.
+        for old_id, original in reversed(aliases):
+            if original in id_map:
+                id_map[old_id] = id_map[original]
+        self.created[label] += len(objects)
+        self.new_ids[label].extend(pk for pk in ids if pk is not None)
+        if label in INTERACTIONS:
+            self.users.update(record['fields']['user'] for record in records)
+
+    def remap_relations(self, item, record):
+        fields = record['fields']
+        for name, target in item.relations.items():
+            new_id = self.id_maps[target].get(fields[name])
+            if new_id is None:
+                self.skipped[item.label] += 1
+                return False
+            fields[name] = new_id
+        return True
+
+    @staticmethod
+    def field_values(item, record):
+        return {
+            (f'{name}_id' if name in item.relations else name): value
+            for name, value in record['fields'].items()
+            if name in item.fields
+        }
+
+    def drop_existing(self, item, records):
+        """Отбрасывает записи, совпадающие по уникальным полям.
+
+        Возвращает оставшиеся записи и пары (старый ключ, старый ключ
+        оригинала) для повторов внутри пакета: их ключи известны только
+        после вставки оригинала.
+        """
+        id_map = self.id_maps[item.label]
+        aliases = []
+        for key in item.unique_keys:
+            def values(record):
+                return tuple(record['fields'][name] for name in key)
+
+            existing = item.model.objects.filter(**{
+                f'{key[0]}__in': {values(record)[0] for record in records}
+            }).values_list('pk', *key)
+            found = {tuple(value): pk for pk, *value in existing}
+            kept = []
+            for record in records:
+                value = values(record)
+                if value not in found:
+                    found[value] = record
+                    kept.append(record)
+                    continue
+                match = found[value]
+                if isinstance(match, dict):
+                    aliases.append((record['pk'], match['pk']))
+                else:
+                    id_map[record['pk']] = match
+                self.skipped[item.label] += 1
+            records = kept
+        return records, aliases
+
+    def allocate(self, item, records):
+        if item.label not in REFERENCED or not records:
+            return [None] * len(records)
+        ids = allocate_ids(item.model, len(records))
+        id_map = self.id_maps[item.label]
+        for record, pk in zip(records, ids):
+            id_map[record['pk']] = pk
+        return ids
+
+    def reset_sequences(self):
+        # В PostgreSQL ключи уже взяты из последовательностей.
+        if connection.vendor == 'postgresql':
+            return
+        models = [DATASET_BY_LABEL[label].model for label in self.new_ids]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def refresh(self):
+        """Обновляет производные данные: bulk_create не отправляет
+        сигналов.
+
+        refresh_cards заодно сбрасывает записи рецептов в api_cache и
+        ставит в очередь публикацию лент и sitemap.
+        """
+        recipe_ids = self.new_ids['recipes.recipe']
+        for start in range(0, len(recipe_ids), self.batch_size):
+            chunk = recipe_ids[start:start + self.batch_size]
+            recipes = Recipe.objects.filter(pk__in=chunk)
+            refresh_cards(recipes)
+            refresh_signatures(recipes)
+        if self.created['recipes.tag']:
+            invalidate_tag_map()
+            api_cache.invalidate('tags')
+        if self.created['recipes.ingredient']:
+            api_cache.invalidate('ingredients')
+        User.objects.filter(pk__in=self.users).update(
+            interactions_changed_at=timezone.now()
+        )
+
+
+class Command(BaseCommand):
+    help = 'Загрузка пользователей и рецептов из файла NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', type=str, default='-',
+            help='Файл выгрузки (.ndjson или .ndjson.gz), по умолчанию stdin'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Количество записей в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        importer = Importer(options['batch_size'])
+        with open_dataset(options['path'], 'r') as lines:
+            importer.run(lines)
+        importer.refresh()
+        for label in DATASET_BY_LABEL:
+            if label in importer.created or label in importer.skipped:
+                self.stdout.write(
+                    f'{label}: добавлено {importer.created[label]}, '
+                    f'пропущено {importer.skipped[label]}'
+                )
+        self.stdout.write(self.style.SUCCESS('Данные успешно загружены.'))
@@ -0,0 +1,108 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from api.filters import IngredientFilter, UserFilter
+from recipes.models import (FavoritesList, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingList, Tag)
+from users.models import Subscription, User
+
+SEQUENTIAL_SCANS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)'),
+}
+
+
+def canonical_queries(user_id, recipe_id, tag_slug, ingredient_prefix):
+    """Запросы, которые API выполняет на каждой горячей странице."""
+    return {
+        'Лента рецептов': Recipe.objects.order_by('-pub_date')[:6],
+        'Рецепты автора': Recipe.objects.filter(
+            author_id=user_id
+        ).order_by('-pub_date')[:6],
+        'Рецепты по тегу': Recipe.objects.filter(
+            tags__slug__in=[tag_slug]
+        ).order_by('-pub_date')[:6],
+        'Избранные рецепты': Recipe.objects.filter(
+            favorites__user_id=user_id
+        ).order_by('-pub_date')[:6],
+        'Рецепты в корзине': Recipe.objects.filter(
+            shopping__user_id=user_id
+        ).order_by('-pub_date')[:6],
+        'Рецепт в избранном': FavoritesList.objects.filter(
+            user_id=user_id, recipe_id=recipe_id
+        ),
+        'Рецепт в корзине': ShoppingList.objects.filter(
+            user_id=user_id, recipe_id=recipe_id
+        ),
+        'Избранное рецепта': FavoritesList.objects.filter(
+            recipe_id=recipe_id
+        ),
+        'Подписки': User.objects.filter(author__user_id=user_id)[:6],
+        'Проверка подписки': Subscription.objects.filter(
+            user_id=user_id, author_id=recipe_id
+        ),
+        'Поиск ингредиента': IngredientFilter(
+            {'name': ingredient_prefix}, queryset=Ingredient.objects.all()
+        ).qs,
+        'Поиск пользователя': UserFilter(
+            {'search': ingredient_prefix}, queryset=User.objects.all()
+        ).qs[:6],
+        'Список покупок': RecipeIngredient.objects.filter(
+            recipe__shopping__user_id=user_id
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(total=Sum('amount')).order_by('ingredient__name'),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для основных запросов проекта и отмечает '
+            'последовательное сканирование таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов, а не только проблемных'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если найдено сканирование таблиц'
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCANS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'База данных {connection.vendor} не поддерживается'
+            )
+        user_id = User.objects.values_list('id', flat=True).first() or 0
+        recipe_id = Recipe.objects.values_list('id', flat=True).first() or 0
+        tag_slug = Tag.objects.values_list('slug', flat=True).first() or ''
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+
+        problems = 0
+        for name, queryset in canonical_queries(
+            user_id, recipe_id, tag_slug, (ingredient or 'а')[:3]
+        ).items():
+            plan = queryset.explain()
+            scans = sorted(set(pattern.findall(plan)))
+            if scans:
+                problems += 1
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: сканирование {", ".join(scans)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+            if scans or options['verbose_plans']:
+                self.stdout.write(plan + '\n')
+
+        self.stdout.write(
+            'Планировщик выбирает сканирование для маленьких таблиц даже '
+            'при наличии индекса; проверяйте отчёт на реальном объёме '
+            'данных (см. seed_benchmark_data).'
+        )
+        if problems and options['strict']:
+            raise CommandError(f'Запросов со сканированием: {problems}')
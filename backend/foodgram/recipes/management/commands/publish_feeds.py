@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.feeds import publish_all
+
+
+class Command(BaseCommand):
+    help = ('Генерирует ленты Atom/RSS и sitemap.xml в FEEDS_ROOT и '
+            'удаляет файлы удалённых тегов, авторов и шардов.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        authors, shards = publish_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'{settings.FEEDS_ROOT}: лент авторов {authors}, '
+            f'шардов sitemap {shards} за '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
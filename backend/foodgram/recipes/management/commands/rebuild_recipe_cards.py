@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.cards import refresh_cards
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает карточки рецептов (recipes.RecipeCard).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--author', type=int, default=None,
+            help='Только рецепты автора с указанным id'
+        )
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Только рецепты без карточки'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['author'] is not None:
+            recipes = recipes.filter(author_id=options['author'])
+        if options['missing']:
+            recipes = recipes.filter(card__isnull=True)
+        started = time.perf_counter()
+        total = refresh_cards(recipes)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Карточек: {total} за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-6):.0f}/с)'
+        ))
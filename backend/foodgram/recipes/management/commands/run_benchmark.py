@@ -0,0 +1,228 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+# Однопиксельный PNG для сценария создания рецепта.
+PIXEL_PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию сценария, изменяющего данные."""
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон основных сценариев API через тестовый '
+            'клиент Django с выводом результатов в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Количество запросов на сценарий'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Количество прогревочных запросов, не входящих в замеры'
+        )
+        parser.add_argument(
+            '--flows', nargs='+', default=None,
+            help='Запустить только перечисленные сценарии'
+        )
+        parser.add_argument(
+            '--output', type=str, default=None,
+            help='Файл для отчёта; по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--conn-max-age', type=int, default=None,
+            help='Переопределить CONN_MAX_AGE на время прогона, чтобы '
+                 'сравнить работу с постоянными соединениями и без них'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prepare()
+        flows = self.get_flows()
+        names = options['flows'] or list(flows)
+        unknown = set(names) - set(flows)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+
+        if options['conn_max_age'] is not None:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+        self.connections = 0
+        connection_created.connect(self.count_connection)
+        report = {
+            'requests': options['requests'],
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'flows': {},
+        }
+        with tempfile.TemporaryDirectory() as media_root:
+            # Один процесс: кэш в памяти процесса согласован.
+            with override_settings(MEDIA_ROOT=media_root,
+                                   THROTTLE_ENABLED=False,
+                                   API_CACHE_ALLOW_LOCAL=True):
+                for name in names:
+                    for _ in range(options['warmup']):
+                        flows[name]()
+                    report['flows'][name] = self.measure(
+                        flows[name], options['requests']
+                    )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def prepare(self):
+        self.user = (
+            User.objects.filter(shopping__isnull=False).first()
+            or User.objects.first()
+        )
+        self.recipe_ids = list(
+            Recipe.objects.values_list('id', flat=True)[:1000]
+        )
+        if self.user is None or not self.recipe_ids:
+            raise CommandError(
+                'Нет данных: сначала выполните seed_benchmark_data'
+            )
+        if Recipe.objects.filter(card__isnull=True).exists():
+            raise CommandError(
+                'Не у всех рецептов есть карточки, замеры не отражали бы '
+                'рабочий путь чтения: выполните rebuild_recipe_cards '
+                '--missing'
+            )
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', 'name')[:500]
+        )
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.anonymous = Client()
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def get_flows(self):
+        return {
+            'recipes_list': self.recipes_list,
+            'recipes_list_filtered': self.recipes_list_filtered,
+            'recipe_detail': self.recipe_detail,
+            'ingredients_autocomplete': self.ingredients_autocomplete,
+            'subscriptions': self.subscriptions,
+            'download_shopping_cart': self.download_shopping_cart,
+            'recipe_create': self.recipe_create,
+        }
+
+    def count_connection(self, **kwargs):
+        self.connections += 1
+
+    def measure(self, flow, count):
+        timings, queries, statuses = [], [], set()
+        self.connections = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            request_started = time.perf_counter()
+            # Тестовый клиент отключает close_old_connections; вызываем
+            # его сами, как WSGIHandler в начале и в конце запроса, чтобы
+            # учитывать открытие соединений.
+            close_old_connections()
+            with CaptureQueriesContext(connection) as captured:
+                status = flow()
+            close_old_connections()
+            timings.append((time.perf_counter() - request_started) * 1000)
+            queries.append(len(captured))
+            statuses.add(status)
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(percentile(timings, 0.50), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries_per_request': round(statistics.mean(queries), 2),
+            'max_queries': max(queries),
+            'throughput_rps': round(count / elapsed, 2),
+            'connections_per_request': round(self.connections / count, 2),
+            'statuses': sorted(statuses),
+        }
+
+    def recipes_list(self):
+        page = self.random.randint(1, 5)
+        return self.anonymous.get(
+            '/api/recipes/', {'page': page, 'limit': 6}
+        ).status_code
+
+    def recipes_list_filtered(self):
+        tags = self.random.sample(
+            self.tag_slugs, min(2, len(self.tag_slugs))
+        )
+        return self.client.get('/api/recipes/', {
+            'tags': tags, 'is_favorited': self.random.choice([0, 1]),
+            'limit': 6,
+        }).status_code
+
+    def recipe_detail(self):
+        recipe_id = self.random.choice(self.recipe_ids)
+        return self.client.get(f'/api/recipes/{recipe_id}/').status_code
+
+    def ingredients_autocomplete(self):
+        _, name = self.random.choice(self.ingredients)
+        return self.anonymous.get(
+            '/api/ingredients/', {'name': name[:3]}
+        ).status_code
+
+    def subscriptions(self):
+        return self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 3}
+        ).status_code
+
+    def download_shopping_cart(self):
+        return self.client.get(
+            '/api/recipes/download_shopping_cart/'
+        ).status_code
+
+    def recipe_create(self):
+        """Создаёт рецепт и откатывает транзакцию, не меняя базу."""
+        ingredients = self.random.sample(
+            self.ingredients, min(5, len(self.ingredients))
+        )
+        data = {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PIXEL_PNG,
+            'tags': self.tag_ids[:2],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id, _ in ingredients
+            ],
+        }
+        try:
+            with transaction.atomic():
+                status = self.client.post(
+                    '/api/recipes/', data, content_type='application/json'
+                ).status_code
+                raise Rollback
+        except Rollback:
+            return status
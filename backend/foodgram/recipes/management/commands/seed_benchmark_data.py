@@ -0,0 +1,224 @@
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from api.caching import api_cache
+from recipes.cards import refresh_cards
+from recipes.duplicates import refresh_signatures
+from recipes.models import (FavoritesList, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingList, Tag)
+from recipes.tag_map import invalidate_tag_map
+from users.models import Subscription, User
+
+USERS_PER_SCALE = 100
+AUTHOR_SHARE = 0.3
+RECIPES_PER_SCALE = 500
+SUBSCRIPTIONS_PER_USER = (0, 15)
+FAVORITES_PER_USER = (0, 30)
+CART_PER_USER = (0, 8)
+INGREDIENTS_PER_RECIPE = (3, 12)
+TAGS_PER_RECIPE = (1, 3)
+BENCHMARK_PASSWORD = 'benchmark-password'
+BENCHMARK_IMAGE = 'recipes/images/benchmark.jpg'
+TAGS = [
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#C0694F', 'baking'),
+    ('Суп', '#2D9CDB', 'soup'),
+    ('Салат', '#6FCF97', 'salad'),
+    ('Постное', '#9B51E0', 'lenten'),
+]
+WORDS = [
+    'пирог', 'суп', 'салат', 'каша', 'рагу', 'запеканка', 'паста',
+    'с курицей', 'с грибами', 'с сыром', 'по-домашнему', 'овощной',
+    'быстрый', 'острый', 'бабушкин', 'летний', 'зимний', 'сливочный',
+]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class IdAllocator:
+    """Выдаёт первичные ключи заранее, чтобы не перечитывать вставленное."""
+
+    def __init__(self, model):
+        current = model.objects.aggregate(Max('pk'))['pk__max']
+        self.next_id = (current or 0) + 1
+
+    def take(self, count):
+        start = self.next_id
+        self.next_id += count
+        return range(start, self.next_id)
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных тестов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, default=1,
+            help=(f'Масштаб: {USERS_PER_SCALE} пользователей и '
+                  f'{RECIPES_PER_SCALE} рецептов на единицу')
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Количество строк в одном bulk_create'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Начальное значение генератора случайных чисел'
+        )
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--scale и --batch-size должны быть больше 0')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты командой import_csv_command'
+            )
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        tag_ids = self.create_tags()
+        user_ids = self.create_users(options['scale'] * USERS_PER_SCALE)
+        authors = user_ids[:max(1, int(len(user_ids) * AUTHOR_SHARE))]
+        recipe_ids = self.create_recipes(
+            options['scale'] * RECIPES_PER_SCALE,
+            authors, tag_ids, ingredient_ids
+        )
+        self.create_interactions(user_ids, authors, recipe_ids)
+        self.reset_sequences()
+        self.refresh(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {len(user_ids)} пользователей и {len(recipe_ids)} '
+            f'рецептов за {time.monotonic() - started:.1f} с.'
+        ))
+
+    def bulk_insert(self, model, objects):
+        for chunk in chunked(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    def create_tags(self):
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=color, slug=slug)
+             for name, color, slug in TAGS],
+            ignore_conflicts=True
+        )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        ids = IdAllocator(User).take(count)
+        password = make_password(BENCHMARK_PASSWORD)
+        self.bulk_insert(User, (
+            User(id=pk, email=f'bench{pk}@example.com',
+                 username=f'bench{pk}', first_name='Тест',
+                 last_name=f'Пользователь {pk}', password=password)
+            for pk in ids
+        ))
+        return list(ids)
+
+    def create_recipes(self, count, authors, tag_ids, ingredient_ids):
+        ids = IdAllocator(Recipe).take(count)
+        self.bulk_insert(Recipe, (
+            Recipe(id=pk, author_id=self.random.choice(authors),
+                   name=' '.join(self.random.sample(WORDS, 2)).capitalize(),
+                   image=BENCHMARK_IMAGE, text='Описание рецепта. ' * 10,
+                   cooking_time=self.random.randint(5, 180))
+            for pk in ids
+        ))
+        self.bulk_insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=pk, tag_id=tag_id)
+            for pk in ids
+            for tag_id in self.random.sample(
+                tag_ids,
+                min(len(tag_ids), self.random.randint(*TAGS_PER_RECIPE))
+            )
+        ))
+        self.bulk_insert(RecipeIngredient, (
+            RecipeIngredient(recipe_id=pk, ingredient_id=ingredient_id,
+                             amount=self.random.randint(1, 500))
+            for pk in ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids,
+                min(len(ingredient_ids),
+                    self.random.randint(*INGREDIENTS_PER_RECIPE))
+            )
+        ))
+        return list(ids)
+
+    def create_interactions(self, user_ids, authors, recipe_ids):
+        recipes = self.random.sample(recipe_ids, len(recipe_ids))
+        pick = self.popular_picker(recipes)
+        pick_author = self.popular_picker(authors)
+        self.bulk_insert(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in pick_author(SUBSCRIPTIONS_PER_USER)
+            if author_id != user_id
+        ))
+        self.bulk_insert(FavoritesList, (
+            FavoritesList(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in pick(FAVORITES_PER_USER)
+        ))
+        self.bulk_insert(ShoppingList, (
+            ShoppingList(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in pick(CART_PER_USER)
+        ))
+
+    def popular_picker(self, population):
+        """Выборка с перекосом к началу списка, как у реальных лайков."""
+        cum_weights = []
+        total = 0
+        for rank in range(len(population)):
+            total += 1 / (rank + 1)
+            cum_weights.append(total)
+
+        def pick(bounds):
+            return set(self.random.choices(
+                population, cum_weights=cum_weights,
+                k=self.random.randint(*bounds)
+            ))
+        return pick
+
+    def refresh(self, recipe_ids):
+        """Обновляет производные данные: bulk_create не отправляет
+        сигналов.
+
+        Без карточек и подписей run_benchmark измерял бы запасной путь
+        чтения. Индекс поиска процессы API перечитывают из базы сами.
+        """
+        recipes = Recipe.objects.filter(
+            pk__range=(recipe_ids[0], recipe_ids[-1])
+        )
+        refresh_cards(recipes)
+        refresh_signatures(recipes, batch_size=self.batch_size)
+        invalidate_tag_map()
+        api_cache.invalidate('tags')
+
+    @staticmethod
+    def reset_sequences():
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
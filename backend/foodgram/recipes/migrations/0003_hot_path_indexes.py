@@ -0,0 +1,56 @@
+# Generated by Django 3.2 on 2026-10-19 10:21
+
+from django.db import migrations, models
+
+INGREDIENT_PREFIX_INDEX = 'ingredient_name_lower_prefix_idx'
+RECIPE_TAGS_INDEX = 'recipe_tags_tag_recipe_idx'
+
+
+def create_ingredient_prefix_index(apps, schema_editor):
+    """Индекс для поиска по префиксу LOWER(name) LIKE 'abc%'.
+
+    В PostgreSQL такой индекс нужен с классом операторов
+    text_pattern_ops; SQLite не использует индексы для LIKE.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INGREDIENT_PREFIX_INDEX} '
+        'ON recipes_ingredient (LOWER(name) text_pattern_ops)'
+    )
+
+
+def drop_ingredient_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INGREDIENT_PREFIX_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shoppinglist',
+            options={'ordering': ['id'], 'verbose_name': 'Список покупок', 'verbose_name_plural': 'Списки покупок'},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunSQL(
+            f'CREATE INDEX {RECIPE_TAGS_INDEX} '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            f'DROP INDEX {RECIPE_TAGS_INDEX}',
+        ),
+        migrations.RunPython(
+            create_ingredient_prefix_index, drop_ingredient_prefix_index
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image
+
+from recipes.images import HASHED_NAME
+
+
+def fill_image_width(apps, schema_editor):
+    """Ширина уже загруженных изображений для srcset (читается заголовок)."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    widths = {}
+    for name in Recipe.objects.values_list('image', flat=True).distinct():
+        if not name or not HASHED_NAME.match(name):
+            continue
+        try:
+            with default_storage.open(name) as file:
+                widths[name] = Image.open(file).width
+        except (OSError, ValueError):
+            continue
+    for name, width in widths.items():
+        Recipe.objects.filter(image=name).update(image_width=width)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_trigram_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина изображения'),
+        ),
+        migrations.RunPython(fill_image_width, migrations.RunPython.noop),
+    ]
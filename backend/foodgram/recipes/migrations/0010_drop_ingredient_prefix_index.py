@@ -0,0 +1,33 @@
+from django.db import migrations
+
+INGREDIENT_PREFIX_INDEX = 'ingredient_name_lower_prefix_idx'
+
+
+def drop_ingredient_prefix_index(apps, schema_editor):
+    """Поиск по началу названия обслуживает ingredient_name_trgm_idx
+    (ILIKE в recipes.search), индекс по LOWER(name) больше не нужен."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INGREDIENT_PREFIX_INDEX}')
+
+
+def create_ingredient_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INGREDIENT_PREFIX_INDEX} '
+        'ON recipes_ingredient (LOWER(name) text_pattern_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_width'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_ingredient_prefix_index, create_ingredient_prefix_index
+        ),
+    ]
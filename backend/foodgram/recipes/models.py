@@ -69,6 +69,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/images/'
     )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина изображения',
+        null=True,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -94,11 +100,35 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+    views = models.PositiveIntegerField(
+        verbose_name='Просмотры',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-views'], name='recipe_views_idx'
+            ),
+            models.Index(
+                fields=['-updated_at'], name='recipe_updated_at_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} {self.text}'
@@ -195,3 +225,77 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f"{self.recipe} {self.user}"
+
+
+class RecipeCard(models.Model):
+    """Готовая карточка рецепта для списков; см. recipes.cards."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card',
+        verbose_name='Рецепт'
+    )
+    data = models.JSONField(
+        verbose_name='Карточка'
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Обновлена',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Карточка рецепта'
+        verbose_name_plural = 'Карточки рецептов'
+
+    def __str__(self):
+        return f'Карточка {self.recipe_id}'
+
+
+class RecipeSignature(models.Model):
+    """MinHash-подпись рецепта для поиска дублей; см. recipes.duplicates."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Рецепт'
+    )
+    signature = models.BinaryField(
+        verbose_name='Подпись'
+    )
+
+    class Meta:
+        verbose_name = 'Подпись рецепта'
+        verbose_name_plural = 'Подписи рецептов'
+
+    def __str__(self):
+        return f'Подпись {self.recipe_id}'
+
+
+class RecipeBucket(models.Model):
+    """Корзина LSH: рецепты с совпадающей полосой подписи."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='buckets',
+        verbose_name='Рецепт'
+    )
+    band = models.PositiveSmallIntegerField(
+        verbose_name='Полоса'
+    )
+    bucket = models.BigIntegerField(
+        verbose_name='Хеш полосы'
+    )
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket'], name='recipe_bucket_band_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.band}/{self.bucket}'
@@ -0,0 +1,233 @@
+"""Нечёткий поиск ингредиентов и рецептов по названию.
+
+Запрос дополняется вариантами в другой раскладке клавиатуры («njvfn» —
+«томат») и в транслитерации («moloko» — «молоко»). Результаты
+ранжируются по триграммному сходству, совпадения по началу названия
+идут первыми, выдача ограничена SEARCH_LIMIT.
+
+В PostgreSQL поиск выполняет pg_trgm по GIN-индексам: оператор % и
+similarity() для сходства, ILIKE 'запрос%' для совпадения начала. Для
+других баз в процессе строится триграммный индекс названий — та же
+метрика, что у pg_trgm; он обновляется сигналами при изменении в этом
+процессе и перестраивается раз в SEARCH_INDEX_TTL секунд, чтобы
+подхватить изменения из других воркеров.
+"""
+import re
+import threading
+import time
+from collections import Counter
+
+from django.db import connection
+from django.db.models import (Case, CharField, IntegerField, Lookup, Q,
+                              Value, When)
+from django.db.models.functions import Greatest
+
+from recipes.models import Ingredient, Recipe
+
+SEARCH_LIMIT = 30
+SIMILARITY_THRESHOLD = 0.3
+SEARCH_INDEX_TTL = 300
+
+LATIN_LAYOUT = "qwertyuiop[]asdfghjkl;'zxcvbnm,.`"
+CYRILLIC_LAYOUT = 'йцукенгшщзхъфывапролджэячсмитьбюё'
+TO_CYRILLIC_LAYOUT = str.maketrans(LATIN_LAYOUT, CYRILLIC_LAYOUT)
+TO_LATIN_LAYOUT = str.maketrans(CYRILLIC_LAYOUT, LATIN_LAYOUT)
+
+TRANSLIT = [
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'),
+    ('ch', 'ч'), ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'),
+    ('a', 'а'), ('b', 'б'), ('v', 'в'), ('g', 'г'), ('d', 'д'),
+    ('e', 'е'), ('ye', 'е'), ('z', 'з'), ('i', 'и'), ('y', 'ы'),
+    ('j', 'й'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'),
+    ('o', 'о'), ('p', 'п'), ('r', 'р'), ('s', 'с'), ('t', 'т'),
+    ('u', 'у'), ('f', 'ф'), ('h', 'х'), ('c', 'к'), ('w', 'в'),
+    ('x', 'кс'), ('q', 'к'),
+]
+# Для обратной транслитерации берётся первое написание буквы в TRANSLIT
+# (к — k, а не c или q), поэтому частые написания стоят раньше редких.
+TRANSLIT_PATTERN = re.compile('|'.join(latin for latin, _ in TRANSLIT))
+TRANSLIT_MAP = dict(TRANSLIT)
+VOWEL_SWAPS = {'о': 'а', 'а': 'о', 'е': 'и', 'и': 'е'}
+MAX_VOWEL_VARIANTS = 6
+# Каждый вариант — отдельное условие запроса; остальные отбрасываются.
+MAX_QUERY_VARIANTS = 8
+REVERSE_TRANSLIT = {}
+for latin, cyrillic in TRANSLIT:
+    REVERSE_TRANSLIT.setdefault(cyrillic, latin)
+
+
+def query_variants(query):
+    """Запрос, он же в другой раскладке, в транслитерации и с заменой
+    безударных гласных (тамат — томат)."""
+    query = ' '.join(query.lower().split())
+    variants = [query]
+    if re.search('[a-z]', query):
+        variants.append(query.translate(TO_CYRILLIC_LAYOUT))
+        variants.append(TRANSLIT_PATTERN.sub(
+            lambda match: TRANSLIT_MAP[match.group()], query
+        ))
+    if re.search('[а-яё]', query):
+        variants.append(query.translate(TO_LATIN_LAYOUT))
+        variants.append(''.join(
+            REVERSE_TRANSLIT.get(char, char) for char in query
+        ))
+    for variant in list(variants[:1] + variants[2:3]):
+        variants.extend(vowel_variants(variant))
+    return list(dict.fromkeys(
+        variant for variant in variants if variant
+    ))[:MAX_QUERY_VARIANTS]
+
+
+def vowel_variants(word):
+    """Варианты с одной заменой о/а или е/и — частые опечатки."""
+    return [
+        word[:position] + VOWEL_SWAPS[char] + word[position + 1:]
+        for position, char in enumerate(word) if char in VOWEL_SWAPS
+    ][:MAX_VOWEL_VARIANTS]
+
+
+def trigrams(text):
+    """Триграммы как в pg_trgm: слова дополняются пробелами по краям."""
+    result = set()
+    for word in re.findall(r'\w+', text.lower()):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class TrigramIndex:
+    """Триграммный индекс названий модели в памяти процесса."""
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.names = None
+        self.postings = {}
+        self.loaded_at = 0.0
+
+    def load(self):
+        names, postings = {}, {}
+        rows = self.model.objects.values_list('pk', 'name').iterator()
+        for pk, name in rows:
+            names[pk] = (name.lower(), trigrams(name))
+            for trigram in names[pk][1]:
+                postings.setdefault(trigram, set()).add(pk)
+        self.names, self.postings = names, postings
+        self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        with self.lock:
+            if (self.names is None or time.monotonic() - self.loaded_at
+                    > SEARCH_INDEX_TTL):
+                self.load()
+
+    def update(self, pk, name=None):
+        with self.lock:
+            if self.names is None:
+                return
+            _, old = self.names.pop(pk, ('', set()))
+            for trigram in old:
+                self.postings.get(trigram, set()).discard(pk)
+            if name is not None:
+                self.names[pk] = (name.lower(), trigrams(name))
+                for trigram in self.names[pk][1]:
+                    self.postings.setdefault(trigram, set()).add(pk)
+
+    def search(self, variants, limit=SEARCH_LIMIT):
+        """id по убыванию (совпадение начала, сходство)."""
+        self.ensure_loaded()
+        scores = {}
+        for variant in variants:
+            query = trigrams(variant)
+            common = Counter()
+            for trigram in query:
+                common.update(self.postings.get(trigram, ()))
+            for pk, shared in common.items():
+                name, name_trigrams = self.names[pk]
+                score = shared / (len(query) + len(name_trigrams) - shared)
+                prefix = name.startswith(variant)
+                if score >= SIMILARITY_THRESHOLD or prefix:
+                    scores[pk] = max(scores.get(pk, (False, 0)),
+                                     (prefix, score))
+        ranked = sorted(scores, key=lambda pk: scores[pk], reverse=True)
+        return ranked[:limit]
+
+
+INDEXES = {
+    Ingredient: TrigramIndex(Ingredient),
+    Recipe: TrigramIndex(Recipe),
+}
+
+
+def search(queryset, query, limit=SEARCH_LIMIT):
+    """Отбирает из queryset лучшие совпадения с query по названию."""
+    variants = query_variants(query)
+    if not variants:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        return postgresql_search(queryset, variants, limit)
+    ranked = INDEXES[queryset.model].search(variants, limit=None)
+    ids = []
+    # Ранжированные id пересекаются с остальными фильтрами queryset
+    # порциями, пока не наберётся limit.
+    for start in range(0, len(ranked), 500):
+        chunk = ranked[start:start + 500]
+        allowed = set(queryset.filter(pk__in=chunk).values_list(
+            'pk', flat=True
+        ))
+        ids.extend(pk for pk in chunk if pk in allowed)
+        if len(ids) >= limit:
+            break
+    return order_by_ids(queryset, ids[:limit])
+
+
+def order_by_ids(queryset, ids):
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *[When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        default=Value(len(ids)), output_field=IntegerField(),
+    ))
+
+
+@CharField.register_lookup
+class TrigramIStartsWith(Lookup):
+    """name ILIKE 'запрос%'.
+
+    Встроенный istartswith в PostgreSQL строит UPPER(name) LIKE ..., что
+    не обслуживается GIN-индексом pg_trgm на name; ILIKE обслуживается,
+    поэтому OR с % остаётся объединением индексных сканирований.
+    """
+    lookup_name = 'trigram_istartswith'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [
+            connection.ops.prep_for_like_query(param) + '%'
+            for param in rhs_params
+        ]
+        return f'{lhs} ILIKE {rhs}', lhs_params + rhs_params
+
+
+def postgresql_search(queryset, variants, limit):
+    """Поиск через pg_trgm: %, ILIKE и similarity() по GIN-индексам."""
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    matches = Q()
+    for variant in variants:
+        matches |= Q(name__trigram_similar=variant)
+        matches |= Q(name__trigram_istartswith=variant)
+    similarity = [TrigramSimilarity('name', variant) for variant in variants]
+    prefix = Case(
+        *[When(name__trigram_istartswith=variant, then=Value(1))
+          for variant in variants],
+        default=Value(0), output_field=IntegerField(),
+    )
+    ids = list(queryset.annotate(
+        similarity=Greatest(*similarity) if len(similarity) > 1
+        else similarity[0],
+        prefix=prefix,
+    ).filter(matches).order_by(
+        '-prefix', '-similarity'
+    ).values_list('pk', flat=True)[:limit])
+    return order_by_ids(queryset, ids)
@@ -0,0 +1,126 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.cards import schedule_refresh
+from recipes.feeds import affected, schedule_publish
+from recipes.models import FavoritesList, Ingredient, Recipe, ShoppingList, Tag
+from recipes.search import INDEXES
+from recipes.tag_map import invalidate_tag_map
+from users.models import Subscription, User
+
+# Поля профиля, которые входят в карточку рецепта.
+AUTHOR_CARD_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate_tag_map()
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_card_recipes(sender, instance, **kwargs):
+    instance.card_recipe_ids = list(
+        card_recipes(instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def reference_saved(sender, instance, created, **kwargs):
+    if not created:
+        schedule_refresh(
+            card_recipes(instance).values_list('pk', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def reference_deleted(sender, instance, **kwargs):
+    ids = getattr(instance, 'card_recipe_ids', None)
+    if ids:
+        schedule_refresh(ids)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def name_saved(sender, instance, **kwargs):
+    INDEXES[sender].update(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def name_deleted(sender, instance, **kwargs):
+    INDEXES[sender].update(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None
+                   and not AUTHOR_CARD_FIELDS & set(update_fields)):
+        return
+    schedule_refresh(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=FavoritesList)
+@receiver([post_save, post_delete], sender=ShoppingList)
+@receiver([post_save, post_delete], sender=Subscription)
+def interactions_changed(sender, instance, **kwargs):
+    """Сдвигает watermark пользователя для условных GET-запросов."""
+    User.objects.filter(pk=instance.user_id).update(
+        interactions_changed_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, **kwargs):
+    schedule_publish(recipe_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_feeds(sender, instance, **kwargs):
+    instance.feed_changes = affected(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_unpublished(sender, instance, **kwargs):
+    schedule_publish(**getattr(
+        instance, 'feed_changes', {'recipe_ids': [instance.pk]}
+    ))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, pk_set, **kwargs):
+    """Рецепт пропадает из лент снятых тегов."""
+    if action == 'pre_clear' and isinstance(instance, Recipe):
+        schedule_publish(tag_ids=instance.tags.values_list('pk', flat=True))
+    elif action in ('post_remove', 'post_add') and pk_set:
+        if isinstance(instance, Recipe):
+            schedule_publish(tag_ids=pk_set)
+        else:
+            schedule_publish(recipe_ids=pk_set)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_feeds_changed(sender, **kwargs):
+    schedule_publish(all_tags=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_feed_changed(sender, instance, created=False,
+                        update_fields=None, **kwargs):
+    if created or (update_fields is not None
+                   and not AUTHOR_CARD_FIELDS & set(update_fields)):
+        return
+    schedule_publish(author_ids=[instance.pk])
+
+
+def card_recipes(instance):
+    if isinstance(instance, Tag):
+        return Recipe.objects.filter(tags=instance)
+    return Recipe.objects.filter(recipe_ingr__ingredient=instance)
@@ -0,0 +1,69 @@
+"""Соответствие slug тегов их идентификаторам в памяти процесса.
+
+Тегов мало и меняются они редко, поэтому фильтрам не нужно каждый раз
+загружать их из базы. Карта сбрасывается сигналами при изменении тегов в
+этом процессе и перечитывается не реже раза в TAG_MAP_TTL секунд, чтобы
+изменения из других воркеров тоже становились видны.
+
+Неизвестный slug перечитывает карту один раз и запоминается как промах
+на TAG_MISS_TTL секунд: запросы с несуществующими тегами не загружают
+таблицу тегов каждый раз. Тег, созданный в этом процессе, виден сразу
+(сигнал сбрасывает и промахи), созданный в другом — не позже чем через
+TAG_MISS_TTL секунд.
+"""
+import threading
+import time
+
+from recipes.models import Tag
+
+TAG_MAP_TTL = 60
+TAG_MISS_TTL = 10
+# Больше промахов не хранится: при переполнении они забываются все.
+TAG_MISS_LIMIT = 1000
+
+_lock = threading.Lock()
+_tag_map = None
+_loaded_at = 0.0
+_misses = {}
+
+
+def tag_ids_by_slug(slugs):
+    """Возвращает id тегов; неизвестные slug пропускаются."""
+    tag_map = get_tag_map()
+    unknown = [slug for slug in slugs if slug not in tag_map]
+    if unknown and not known_misses(unknown):
+        tag_map = get_tag_map(refresh=True)
+        remember_misses(slug for slug in unknown if slug not in tag_map)
+    return [tag_map[slug] for slug in slugs if slug in tag_map]
+
+
+def known_misses(slugs):
+    now = time.monotonic()
+    with _lock:
+        return all(_misses.get(slug, 0) > now for slug in slugs)
+
+
+def remember_misses(slugs):
+    expires = time.monotonic() + TAG_MISS_TTL
+    with _lock:
+        for slug in slugs:
+            if len(_misses) >= TAG_MISS_LIMIT:
+                _misses.clear()
+            _misses[slug] = expires
+
+
+def get_tag_map(refresh=False):
+    global _tag_map, _loaded_at
+    with _lock:
+        expired = time.monotonic() - _loaded_at > TAG_MAP_TTL
+        if refresh or expired or _tag_map is None:
+            _tag_map = dict(Tag.objects.values_list('slug', 'id'))
+            _loaded_at = time.monotonic()
+        return _tag_map
+
+
+def invalidate_tag_map():
+    global _tag_map
+    with _lock:
+        _tag_map = None
+        _misses.clear()
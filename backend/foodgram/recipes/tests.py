@@ -0,0 +1,220 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.models import Job
+from recipes.deletion import BatchDeleter, bulk_delete
+from recipes.models import (FavoritesList, Ingredient, Recipe, RecipeCard,
+                            RecipeIngredient, RecipeSignature,
+                            ShoppingList, Tag)
+from recipes.search import INDEXES
+from users.models import Subscription, User
+
+
+def snapshot():
+    """Содержимое базы без первичных ключей."""
+    return {
+        'users': sorted(User.objects.values_list(
+            'email', 'username', 'first_name', 'last_name', 'password'
+        )),
+        'tags': sorted(Tag.objects.values_list('name', 'color', 'slug')),
+        'ingredients': sorted(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        )),
+        'recipes': sorted(
+            (
+                recipe.author.email, recipe.name, recipe.text,
+                recipe.cooking_time, recipe.image.name, recipe.pub_date,
+                sorted(tag.slug for tag in recipe.tags.all()),
+                sorted(
+                    (item.ingredient.name, item.amount)
+                    for item in recipe.recipe_ingr.all()
+                ),
+            )
+            for recipe in Recipe.objects.select_related('author')
+            .prefetch_related('tags', 'recipe_ingr__ingredient')
+        ),
+        'subscriptions': sorted(Subscription.objects.values_list(
+            'user__email', 'author__email'
+        )),
+        'favorites': sorted(FavoritesList.objects.values_list(
+            'user__email', 'recipe__name'
+        )),
+        'shopping': sorted(ShoppingList.objects.values_list(
+            'user__email', 'recipe__name'
+        )),
+    }
+
+
+@override_settings(FEEDS_ENABLED=False, CARDS_ASYNC=False,
+                   API_CACHE_ENABLED=False)
+class ImportExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dump.ndjson.gz')
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Анна', last_name='Петрова', password='secret'
+        )
+        reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Иван', last_name='Иванов', password='secret'
+        )
+        Subscription.objects.create(user=reader, author=author)
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        dinner = Tag.objects.create(
+            name='Ужин', color='#49B64E', slug='dinner'
+        )
+        eggs = Ingredient.objects.create(name='яйца', measurement_unit='шт')
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        for name, tags, amounts in [
+            ('Омлет', [breakfast], {eggs: 3, milk: 100}),
+            ('Яичница', [breakfast, dinner], {eggs: 2}),
+        ]:
+            recipe = Recipe.objects.create(
+                author=author, name=name, text=f'{name}: рецепт',
+                cooking_time=10, image=f'recipes/images/{name}.jpg'
+            )
+            recipe.tags.set(tags)
+            for ingredient, amount in amounts.items():
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+            FavoritesList.objects.create(user=reader, recipe=recipe)
+        ShoppingList.objects.create(user=reader, recipe=recipe)
+
+    def export(self):
+        call_command('export_data', path=self.path, stderr=StringIO())
+
+    def import_(self, batch_size=1000):
+        output = StringIO()
+        call_command('import_data', path=self.path, batch_size=batch_size,
+                     stdout=output)
+        return output.getvalue()
+
+    def clear(self):
+        for model in (Recipe, Tag, Ingredient, User):
+            model.objects.all().delete()
+
+    def test_round_trip(self):
+        expected = snapshot()
+        self.export()
+        self.clear()
+        self.import_(batch_size=2)
+        self.assertEqual(snapshot(), expected)
+        self.assertEqual(RecipeCard.objects.count(), Recipe.objects.count())
+        self.assertEqual(
+            RecipeSignature.objects.count(), Recipe.objects.count()
+        )
+
+    def test_import_into_same_database_reuses_objects(self):
+        self.export()
+        counts = {
+            model: model.objects.count()
+            for model in (User, Tag, Ingredient, Recipe, Subscription)
+        }
+        self.import_()
+        self.assertEqual(User.objects.count(), counts[User])
+        self.assertEqual(Tag.objects.count(), counts[Tag])
+        self.assertEqual(Ingredient.objects.count(), counts[Ingredient])
+        self.assertEqual(Subscription.objects.count(), counts[Subscription])
+        # У рецептов нет естественного ключа: они добавляются заново.
+        self.assertEqual(Recipe.objects.count(), 2 * counts[Recipe])
+
+    def test_counts_skipped_links_and_unique_conflicts(self):
+        self.export()
+        Recipe.objects.all().delete()
+        # Тот же тег под другим slug: название и цвет заняты.
+        Tag.objects.filter(slug='dinner').update(slug='supper')
+        output = self.import_()
+        self.assertIn('recipes.tag: добавлено 0, пропущено 2', output)
+        self.assertIn('users.subscription: добавлено 0, пропущено 1', output)
+        self.assertIn('recipes.recipe: добавлено 2, пропущено 0', output)
+        self.assertEqual(
+            sorted(Recipe.objects.get(name='Яичница').tags.values_list(
+                'slug', flat=True
+            )),
+            ['breakfast', 'supper'],
+        )
+
+
+@override_settings(FEEDS_ENABLED=False, CARDS_ASYNC=False,
+                   API_CACHE_ENABLED=False)
+class BulkDeleteTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Анна', last_name='Петрова', password='secret'
+        )
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='яйца', measurement_unit='шт'
+        )
+        self.job = Job.objects.create(name='build_shopping_list',
+                                      user=self.author)
+        for name in ('Омлет', 'Яичница'):
+            self.add_recipe(name)
+
+    def add_recipe(self, name):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text=name, cooking_time=10,
+            image='recipes/images/recipe.jpg'
+        )
+        recipe.tags.add(self.tag)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=2
+        )
+        return recipe
+
+    def test_deletes_dependants_and_keeps_jobs(self):
+        ids = list(Recipe.objects.values_list('pk', flat=True))
+        INDEXES[Recipe].ensure_loaded()
+        deleted = bulk_delete(User.objects.filter(pk=self.author.pk))
+        self.assertEqual(deleted['recipes.Recipe'], 2)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.job.refresh_from_db()
+        self.assertIsNone(self.job.user)
+        self.assertFalse(set(ids) & set(INDEXES[Recipe].names))
+
+    def test_sweep_deletes_rows_added_during_deletion(self):
+        delete_related = BatchDeleter.delete_related
+        added = []
+
+        def add_recipe_after_first_pass(deleter, relation, pks):
+            delete_related(deleter, relation, pks)
+            if relation.related_model is Recipe and not added:
+                added.append(self.add_recipe('Добавлен во время удаления'))
+
+        with mock.patch.object(BatchDeleter, 'delete_related',
+                               add_recipe_after_first_pass):
+            bulk_delete(User.objects.filter(pk=self.author.pk))
+        self.assertTrue(added)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+
+@override_settings(FEEDS_ENABLED=False, API_CACHE_ENABLED=False)
+class SeedBenchmarkDataTests(TestCase):
+    def test_seeded_recipes_have_cards_and_signatures(self):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        ])
+        call_command('seed_benchmark_data', scale=1, seed=1,
+                     stdout=StringIO())
+        recipes = Recipe.objects.count()
+        self.assertGreater(recipes, 0)
+        self.assertEqual(RecipeCard.objects.count(), recipes)
+        self.assertEqual(RecipeSignature.objects.count(), recipes)
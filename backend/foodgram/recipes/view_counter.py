@@ -0,0 +1,84 @@
+"""Счётчик просмотров рецептов с отложенной записью.
+
+UPDATE строки рецепта на каждый просмотр создаёт конкуренцию за
+популярные строки. Вместо этого каждый воркер копит приращения в памяти
+и записывает их одним запросом
+
+    UPDATE recipes_recipe SET views = views + CASE id WHEN ... END
+    WHERE id IN (...)
+
+когда накопилось VIEW_COUNTER_FLUSH_SIZE просмотров или прошло
+VIEW_COUNTER_FLUSH_INTERVAL секунд (фоновый поток). Буфер сбрасывается и
+при штатной остановке процесса (atexit, worker_exit в gunicorn.conf.py).
+
+При аварийном завершении воркера (SIGKILL, OOM) теряются несохранённые
+просмотры: не больше FLUSH_SIZE и не больше чем за FLUSH_INTERVAL секунд
+на воркер. Поэтому ``views`` — приблизительная величина, в API она
+отстаёт от реальной на время буферизации.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from recipes.models import Recipe
+
+logger = logging.getLogger('api.view_counter')
+
+
+class ViewCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.total = 0
+        self.timer = None
+
+    def increment(self, recipe_id):
+        with self.lock:
+            self.pending[recipe_id] += 1
+            self.total += 1
+            full = self.total >= settings.VIEW_COUNTER_FLUSH_SIZE
+            if self.timer is None:
+                self.start_timer()
+        if full:
+            self.flush()
+
+    def start_timer(self):
+        self.timer = threading.Thread(target=self.run_timer, daemon=True)
+        self.timer.start()
+
+    def run_timer(self):
+        while True:
+            time.sleep(settings.VIEW_COUNTER_FLUSH_INTERVAL)
+            self.flush()
+            connection.close()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending, self.total = self.pending, Counter(), 0
+        if not pending:
+            return 0
+        try:
+            Recipe.objects.filter(pk__in=pending).update(
+                views=F('views') + Case(
+                    *[When(pk=pk, then=Value(count))
+                      for pk, count in pending.items()],
+                    default=Value(0), output_field=PositiveIntegerField(),
+                )
+            )
+        except DatabaseError:
+            logger.exception('Не удалось сохранить просмотры рецептов')
+            with self.lock:
+                self.pending.update(pending)
+                self.total += sum(pending.values())
+            return 0
+        return sum(pending.values())
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
@@ -1,5 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from api.jobs import enqueue
+from .admin_filters import AuthorFilter, SubscriberFilter
 from .models import Subscription, User
 
 
@@ -7,13 +9,31 @@ from .models import Subscription, User
 class UserAdmin(admin.ModelAdmin):
     list_display = ['pk', 'username', 'email', 'first_name', 'last_name']
     search_fields = ['username', 'email', 'first_name', 'last_name']
-    list_filter = ['username', 'email']
+    list_filter = ['is_staff', 'is_active']
+    show_full_result_count = False
     empty_value_display = '-----'
+    actions = ['delete_in_background']
+
+    @admin.action(description='Удалить в фоне вместе с рецептами',
+                  permissions=['delete'])
+    def delete_in_background(self, request, queryset):
+        job = enqueue(
+            'delete_users', user=request.user,
+            user_ids=list(queryset.values_list('pk', flat=True))
+        )
+        self.message_user(
+            request, f'Удаление поставлено в очередь, задача #{job.pk}.',
+            messages.SUCCESS
+        )
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ['pk', 'user', 'author']
-    search_fields = ['user', 'author']
-    list_filter = ['user', 'author']
+    search_fields = ['user__username', 'user__email',
+                     'author__username', 'author__email']
+    list_filter = [SubscriberFilter, AuthorFilter]
+    list_select_related = ['user', 'author']
+    autocomplete_fields = ['user', 'author']
+    show_full_result_count = False
     empty_value_display = '-----'
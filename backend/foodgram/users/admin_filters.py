@@ -0,0 +1,46 @@
+from django.contrib import admin
+from django.db.models import Q
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с текстовым полем вместо списка всех значений."""
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (key, value)
+            for key, value in changelist.get_filters_params().items()
+            if key != self.parameter_name
+        )
+        yield all_choice
+
+
+class UserInputFilter(InputFilter):
+    """Фильтр по email или имени пользователя в поле field_name."""
+    field_name = None
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        value = value.strip()
+        return queryset.filter(
+            Q(**{f'{self.field_name}__email': value})
+            | Q(**{f'{self.field_name}__username': value})
+        )
+
+
+class AuthorFilter(UserInputFilter):
+    title = 'автору'
+    parameter_name = 'author'
+    field_name = 'author'
+
+
+class SubscriberFilter(UserInputFilter):
+    title = 'подписчику'
+    parameter_name = 'user'
+    field_name = 'user'
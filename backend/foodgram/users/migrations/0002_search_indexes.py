@@ -0,0 +1,38 @@
+from django.db import migrations
+
+PREFIX_INDEXES = {
+    'user_username_lower_prefix_idx': 'username',
+    'user_email_lower_prefix_idx': 'email',
+}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """Индексы для поиска по префиксу LOWER(field) LIKE 'abc%'.
+
+    Как и для ингредиентов, нужны только в PostgreSQL.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, field in PREFIX_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} '
+            f'ON users_user (LOWER({field}) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in PREFIX_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
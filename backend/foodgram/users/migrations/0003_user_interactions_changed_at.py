@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='interactions_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Изменение избранного, корзины или подписок'),
+        ),
+    ]
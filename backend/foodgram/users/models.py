@@ -21,6 +21,12 @@ class User(AbstractUser):
         'Имя пользователя',
         max_length=150
     )
+    interactions_changed_at = models.DateTimeField(
+        'Изменение избранного, корзины или подписок',
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']